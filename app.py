@@ -1,14 +1,24 @@
 import json
 import os
+import shutil
+import sys
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify
 from flask_cors import CORS
 from datetime import datetime
-import bus_detection
-import label_automation
-from classes.lta_api import bus_order
+from classes.startup_profiler import lazy_import, startup_profiler
+from classes.lta_api import ArrivalService
 from classes.roboflow_api import RoboflowAPI
-import multiprocessing
+from classes.detection_service import DetectionService
+from classes.result_store import ResultStore
+from classes.speech_queue import SpeechQueue
+from classes.job_queue import JobQueue
+from classes.file_index import VIDEO_FORMATS, FileIndex
+from classes.chunked_upload import ChunkedUploads, UploadError
+
+# torch, torchvision, pandas and cv2 are imported by the first route that needs them, see /startup
+label_automation = lazy_import("label_automation")
+cv2 = lazy_import("cv2")
 
 app = Flask(__name__, template_folder='templates')
 CORS(app, origins=["http://172.20.10.*","http://192.168.*","http://localhost:5000"])
@@ -20,6 +30,21 @@ output_dir = os.path.join(app.instance_path, 'outputs')
 os.makedirs(output_dir, exist_ok=True)
 models_dir = os.path.join(app.instance_path, 'models')
 os.makedirs(models_dir, exist_ok=True)
+upload_extensions = (".mp4", ".jpg", ".png", ".mov")  # matched case-insensitively, i.e. clip.MOV
+upload_index = FileIndex(uploads_dir, upload_extensions, include_dirs=True,
+                         cache_path=os.path.join(app.instance_path, 'uploads_index.json'))
+model_index = FileIndex(models_dir, (".pt", ".onnx"), cache_path=os.path.join(app.instance_path, 'models_index.json'))
+chunked_uploads = ChunkedUploads(uploads_dir, os.path.join(app.instance_path, 'upload_parts'),
+                                 extensions=upload_extensions, on_complete=upload_index.register)
+
+# arg 0 for webcam, or put files e.g. instance/uploads/bus_vid_part2.mp4
+result_store = ResultStore(snapshot_path="live_data/output_labels.json", snapshot_interval=5.0)
+speech_queue = SpeechQueue()  # one TTS engine for the lifetime of the app
+arrival_service = ArrivalService(os.getenv("LTA_API_KEY", ""))  # DataMall account key
+detection_service = DetectionService("instance/models/bus_trafficlight_21jul.pt", 0, conf_thres=0.85,
+                                     result_store=result_store, speech=speech_queue,
+                                     autobackend=os.getenv("AUTOBACKEND", "1") == "1",  # fastest CPU backend
+                                     fastload=os.getenv("FASTLOAD", "fused"))  # fused, torchscript or empty
 
 
 @app.route("/")
@@ -52,33 +77,81 @@ def bus_navigation():
 @app.route("/start_bus_detection", methods=['GET', 'POST'])
 def start_bus_detection():
     if request.method == "POST":
-        bus_code = str(request.form.get("code"))
-        print(bus_code)
-        #detection_thread = multiprocessing.Process(target=bus_detection.run,
-        #                                           args=("instance/models/bus_trafficlight_27jun.pt",0,"--conf-thres",0.9))
-        detection_thread = multiprocessing.Process(target=bus_detection.run,
-                                                   args=("instance/models/bus_trafficlight_21jul.pt",0),
-                                                   kwargs={'conf_thres': 0.85})       
-        #arg 0 for webcam, or put files e.g. instance/uploads/bus_vid_part2.mp4
-
-
-        #api_thread.start()
-        detection_thread.start()
+        bus_code = request.form.get("code")
+        expected_routes = None
+        if bus_code and os.getenv("LTA_API_KEY"):  # routes arriving at the stop re-weight route number detections
+            expected_routes = lambda: arrival_service.expected_services(bus_code, cached=True)
+        started = detection_service.start(expected_routes=expected_routes)
+        if started and expected_routes:
+            arrival_service.unwatch()
+            arrival_service.watch(bus_code)
+        if not started:
+            return jsonify(message="Detection already running",
+                           statusCode=200,
+                           data=detection_service.get_status())
     return jsonify(message="Success",
-                   statusCode=200)
+                   statusCode=200,
+                   data=detection_service.get_status())
+
+
+@app.route("/stop_bus_detection", methods=['GET', 'POST'])
+def stop_bus_detection():
+    if request.method == "POST":
+        arrival_service.unwatch()
+        if not detection_service.stop():
+            return jsonify(message="Detection not running",
+                           statusCode=200,
+                           data=detection_service.get_status())
+    return jsonify(message="Success",
+                   statusCode=200,
+                   data=detection_service.get_status())
+
+
+@app.route("/bus_detection_status", methods=['GET'])
+def bus_detection_status():
+    return jsonify(message="Success",
+                   statusCode=200,
+                   data=detection_service.get_status())
+
+
+@app.route("/bus_arrivals/<bus_code>", methods=['GET'])
+def bus_arrivals(bus_code):
+    try:
+        arrivals = arrival_service.get_arrivals(bus_code)
+    except Exception as e:
+        return jsonify(message=f"Bus arrivals unavailable, {e}",
+                       statusCode=502), 502
+    return jsonify(message="Success",
+                   statusCode=200,
+                   data=[a.return_json() for a in arrivals])
 
 
 @app.route("/bus_result", methods=['GET', 'POST'])
 def bus_result():
-    #json_file = open("live_data/bus_labels.json", "r")
-    #result = json.load(json_file)
-    with open('live_data/output_labels.json') as json_file:
-        result = json.load(json_file)
+    version, result = result_store.get()
     return jsonify(message="Success",
                    statusCode=200,
+                   version=version,
                    data=result)
 
 
+@app.route("/bus_stream", methods=['GET'])
+def bus_stream():
+    # Server-Sent Events: pushes the result only when the labels or the update flag change
+    def events():
+        version = None
+        while True:
+            new_version, result = result_store.wait(version, timeout=15)
+            if new_version == version:
+                yield ": keep-alive\n\n"  # comment line keeps proxies from closing idle streams
+                continue
+            version = new_version
+            yield f"id: {version}\ndata: {json.dumps(result)}\n\n"
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.route("/training")
 def training():
     return render_template("training.html", )
@@ -96,65 +169,228 @@ def projects(api_key):
 
 @app.route("/upload", methods=['GET', 'POST'])
 def upload():
-    if request.method == "GET":  # Get all videos in the uploads folder
-        vid_list = []
-        for videos in os.listdir(uploads_dir):
-            if videos.endswith(".mp4") or videos.endswith(".jpg") or videos.endswith(".png") or videos.endswith(".MOV"):
-                vid_list.append(videos)
-        for directories in next(os.walk(uploads_dir))[1]:
-            vid_list.append(directories)
+    if request.method == "GET":  # Get all videos and folders in the uploads folder, with frames and resolution
+        files = upload_index.list()
         return jsonify(message="Success",
                        statusCode=200,
-                       data=vid_list)
+                       data=[f["name"] for f in files],
+                       files=files)
 
     if request.method == "POST":
         fd = request.form
         folder = fd.get("folder")
         api_key = fd.get("apiKey")
         project = fd.get("project")
-        print(folder, api_key, project)
-        rbf = RoboflowAPI(api_key)
-        rbf.set_project(project)
-        uploaded = rbf.upload_image(f"{output_dir}/{folder}")
+        job_id = job_queue.submit("upload", {"folder": folder, "project": project}, secrets={"api_key": api_key})
         return jsonify(message="Success",
                        statusCode=200,
-                       data=uploaded)
+                       data=folder,
+                       job=job_id)
+
+
+@app.route("/uploads", methods=['POST'])
+def init_upload():
+    # Start a chunked upload, body {file_name, size, sha256 (optional)}, returns the id and chunk size
+    fd = request.get_json(silent=True) or request.form
+    try:
+        status = chunked_uploads.init(fd.get("file_name"), fd.get("size"), fd.get("sha256"))
+    except (UploadError, ValueError) as e:
+        return jsonify(message=str(e), statusCode=400), 400
+    return jsonify(message="Success",
+                   statusCode=200,
+                   data=status)
+
+
+@app.route("/uploads/<upload_id>", methods=['GET', 'PUT', 'DELETE'])
+def chunked_upload(upload_id):
+    # PUT /uploads/<id>?offset=<bytes> with the raw chunk as body, chunks can be sent in parallel and resent
+    try:
+        if request.method == "PUT":
+            status = chunked_uploads.write_chunk(upload_id, request.args.get("offset", 0, type=int), request.stream)
+        elif request.method == "DELETE":
+            status = chunked_uploads.status(upload_id)
+            chunked_uploads.abort(upload_id)
+        else:  # offsets still missing, to resume an interrupted upload
+            status = chunked_uploads.status(upload_id)
+    except UploadError as e:
+        return jsonify(message=str(e), statusCode=e.status), e.status
+    return jsonify(message="Success",
+                   statusCode=200,
+                   data=status)
+
+
+@app.route("/uploads/<upload_id>/complete", methods=['POST'])
+def complete_upload(upload_id):
+    try:
+        file_name = chunked_uploads.complete(upload_id)
+    except UploadError as e:
+        return jsonify(message=str(e), statusCode=e.status), e.status
+    return jsonify(message="Success",
+                   statusCode=200,
+                   data=upload_index.get(file_name))
+
+
+def count_frames(path):
+    # Frames in a video (1 for an image), used for job progress and ETA
+    if path.lower().endswith(VIDEO_FORMATS):
+        cap = cv2.VideoCapture(path)
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        return max(frames, 1)
+    return 1
+
+
+def predict_job(params, job):
+    # Auto-labelling job, runs label_automation on every file of the upload on a JobQueue worker.
+    # Finished files are checkpointed and skipped when the job resumes after a restart, and each file is labelled
+    # into a partial folder first, so the one that was interrupted is labelled again without duplicate frames
+    vid = params["vid"]
+    sources = []
+    if vid.lower().endswith(upload_extensions):
+        sources.append(f"instance/uploads/{vid}")
+    elif os.path.isdir(os.path.join(uploads_dir, vid)):  # Directory traversal
+        for videos in sorted(os.listdir(f"{uploads_dir}/{vid}")):
+            if videos.lower().endswith(upload_extensions):
+                sources.append(f"instance/uploads/{vid}/{videos}")
+    if not sources:
+        raise ValueError(f"No {', '.join(upload_extensions)} files found in {vid}")
+
+    img_path = os.path.join(output_dir, params["folder"])
+    partial_path = os.path.join(img_path, ".partial")
+    shutil.rmtree(partial_path, ignore_errors=True)
+    os.makedirs(img_path, exist_ok=True)
+    frames = [count_frames(source) for source in sources]
+
+    finished = set(job.checkpoint.get("files", []))
+    totals = {"kept": 0, "dropped": 0, "decoded": 0, "sampled": 0, **job.checkpoint.get("totals", {})}
+    done = sum(f for source, f in zip(sources, frames) if source in finished)
+    for n, source in enumerate(sources):
+        if job.cancel_event.is_set():
+            break
+        if source in finished:
+            continue
+
+        def progress(decoded, offset=done):
+            job.update_progress(offset + decoded, sum(frames), file=os.path.basename(source), file_index=n + 1,
+                                files=len(sources), **totals)
+
+        # Static stretches of video are skipped by scene-change sampling, with at least one frame every 15
+        stats = label_automation.run(weights=f"instance/models/{params['model']}",
+                                     source=source,
+                                     img_path=partial_path,
+                                     scene_thres=params.get("scene_thres", 3.0),
+                                     max_gap=params.get("max_gap", 15),
+                                     cache_dir=os.path.join(app.instance_path, 'inference_cache'),
+                                     progress=progress,
+                                     stop_event=job.cancel_event)
+        for name in os.listdir(partial_path):
+            os.replace(os.path.join(partial_path, name), os.path.join(img_path, name))
+        done += frames[n]
+        for k in totals:
+            totals[k] += stats.get(k, 0)
+        if not job.cancel_event.is_set():
+            finished.add(source)
+            job.save_checkpoint(files=sorted(finished), totals=totals)
+    shutil.rmtree(partial_path, ignore_errors=True)
+    job.update_progress(done, sum(frames), files=len(sources), **totals)
+    return params["folder"]
+
+
+def upload_job(params, job):
+    # Roboflow upload job, resumable through a manifest of uploaded image hashes shared by all folders
+    api_key = job.get_secrets().get("api_key")
+    if not api_key:
+        raise RuntimeError("API key not available after a restart, please upload again")
+    rbf = RoboflowAPI(api_key)
+    rbf.set_project(params["project"])
+    return rbf.upload_image(os.path.join(output_dir, params["folder"]),
+                            manifest_path=os.path.join(app.instance_path, 'upload_manifest.jsonl'),
+                            progress=job.update_progress,
+                            stop_event=job.cancel_event)
+
+
+job_queue = JobQueue(os.path.join(app.instance_path, 'jobs.json'), {"predict": predict_job, "upload": upload_job})
 
 
 @app.route("/predict", methods=['GET', 'POST'])
 def predict():
     if request.method == "POST":
-        # Create extracted image folder
+        # Create extracted image folder name, the job creates it
         timestamp = datetime.now().strftime("%Y%m%dT%H%M%S")
-        img_path = f'{output_dir}\\{timestamp}'
-        os.mkdir(img_path)
 
         vid = request.form.get("vid")
         model_used = request.form.get("model")
-        if vid.endswith(".jpg") or vid.endswith(".png") or vid.endswith(".mp4") or vid.endswith(".MOV"):
-            label_automation.run(weights=f"instance/models/{model_used}",
-                                 source=f"instance/uploads/{vid}",
-                                 img_path=img_path)
-        elif "." not in vid: # Directory traversal (since no .extension its a folder)
-            for videos in os.listdir(f"{uploads_dir}/{vid}"):
-                label_automation.run(weights=f"instance/models/{model_used}",
-                                     source=f"instance/uploads/{vid}/{videos}",
-                                     img_path=img_path)
+        job_id = job_queue.submit("predict", {"vid": vid, "model": model_used, "folder": timestamp})
         return jsonify(message="Success",
                        statusCode=200,
-                       data=timestamp)
+                       data=timestamp,
+                       job=job_id)
+
+
+@app.route("/jobs", methods=['GET'])
+def jobs():
+    return jsonify(message="Success",
+                   statusCode=200,
+                   data=job_queue.list())
+
+
+@app.route("/jobs/<job_id>", methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify(message="Job not found",
+                       statusCode=404), 404
+    return jsonify(message="Success",
+                   statusCode=200,
+                   data=job)
+
+
+@app.route("/jobs/<job_id>/cancel", methods=['POST'])
+def cancel_job(job_id):
+    if not job_queue.cancel(job_id):
+        return jsonify(message="Job not found or already finished",
+                       statusCode=404), 404
+    return jsonify(message="Success",
+                   statusCode=200,
+                   data=job_queue.get(job_id))
 
 
 @app.route("/models", methods=['GET', 'POST'])
 def models():
     if request.method == "GET":  # Get all models in the models folder
-        mod_list = []
-        for m in os.listdir(models_dir):
-            if m.endswith(".pt"):
-                mod_list.append(m)
+        files = model_index.list()  # classes, parameters, imgsz and sha256 per model
         return jsonify(message="Success",
                        statusCode=200,
-                       data=mod_list)
+                       data=[f["name"] for f in files],
+                       files=files,
+                       resident=resident_models())
+
+
+def resident_models():
+    # Loaded models, without importing torch just to find there are none
+    registry = sys.modules.get("classes.model_registry")
+    return registry.model_registry.resident() if registry else []
+
+
+@app.route("/startup", methods=['GET'])
+def startup():
+    # Import, model load and warmup times, and when the app was ready and the first frame was detected
+    return jsonify(message="Success",
+                   statusCode=200,
+                   data=startup_profiler.return_json())
+
+
+def serving_process():
+    # The debug reloader's file watcher imports the app too but never serves, jobs must only run in its child
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        return True
+    reloader = app.debug if __name__ == "__main__" else os.getenv("FLASK_DEBUG", "").lower() in ("1", "true")
+    return not reloader
+
+
+if serving_process():
+    job_queue.start()  # resume stored jobs under python app.py, flask run and WSGI servers alike
+startup_profiler.mark("app_ready")
 
 
 if __name__ == "__main__":
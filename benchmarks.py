@@ -23,6 +23,7 @@ Requirements:
 
 Usage:
     $ python benchmarks.py --weights yolov5s.pt --img 640
+    $ python benchmarks.py --weights yolov5s.pt --img 640 --batch-source video.mp4 --batch-sizes 1 4 8  # images/s
 """
 
 import argparse
@@ -32,6 +33,7 @@ import time
 from pathlib import Path
 
 import pandas as pd
+import torch
 
 FILE = Path(__file__).resolve()
 ROOT = FILE.parents[0]  # YOLOv5 root directory
@@ -43,9 +45,11 @@ import export
 from models.experimental import attempt_load
 from models.yolo import SegmentationModel
 from segment.val import run as val_seg
+from models.common import DetectMultiBackend
 from utils import notebook_init
-from utils.general import LOGGER, check_yaml, file_size, print_args
-from utils.torch_utils import select_device
+from utils.dataloaders import LoadImages
+from utils.general import LOGGER, check_img_size, check_yaml, file_size, non_max_suppression, print_args
+from utils.torch_utils import select_device, smart_inference_mode
 from val import run as val_det
 
 
@@ -143,6 +147,42 @@ def test(
     return py
 
 
+@smart_inference_mode()
+def batch_throughput(
+        weights=ROOT / 'yolov5s.pt',  # weights path
+        source=ROOT / 'data/images',  # images dir or video used for the offline labelling path
+        imgsz=640,  # inference size (pixels)
+        batch_sizes=(1, 2, 4, 8),  # LoadImages batch sizes to compare
+        device='',  # cuda device, i.e. 0 or 0,1,2,3 or cpu
+        half=False,  # use FP16 half-precision inference
+        max_images=256,  # images per batch size
+):
+    # Images/s of pre-process, inference and NMS through batched LoadImages, as used by label_automation.py
+    device = select_device(device)
+    model = DetectMultiBackend(weights, device=device, fp16=half)
+    imgsz = check_img_size(imgsz, s=model.stride)
+    y = []
+    for bs in batch_sizes:
+        dataset = LoadImages(source, img_size=imgsz, stride=model.stride, auto=model.pt, batch_size=bs)
+        model.warmup(imgsz=(bs, 3, imgsz, imgsz))
+        n, t = 0, time.time()
+        for path, im, _, _, _ in dataset:
+            im = torch.from_numpy(im).to(device)
+            im = (im.half() if model.fp16 else im.float()) / 255
+            if len(im.shape) == 3:
+                im = im[None]  # expand for batch dim
+            non_max_suppression(model(im))
+            n += len(path) if bs > 1 else 1
+            if n >= max_images:
+                break
+        dt = time.time() - t
+        y.append([bs, n, round(n / dt, 2), round(dt / n * 1E3, 2)])
+
+    py = pd.DataFrame(y, columns=['Batch size', 'Images', 'Images/s', 'Time per image (ms)'])
+    LOGGER.info(f'\nBatched throughput on {source}\n{py}')
+    return py
+
+
 def parse_opt():
     parser = argparse.ArgumentParser()
     parser.add_argument('--weights', type=str, default=ROOT / 'yolov5s.pt', help='weights path')
@@ -154,6 +194,8 @@ def parse_opt():
     parser.add_argument('--test', action='store_true', help='test exports only')
     parser.add_argument('--pt-only', action='store_true', help='test PyTorch only')
     parser.add_argument('--hard-fail', nargs='?', const=True, default=False, help='Exception on error or < min metric')
+    parser.add_argument('--batch-source', type=str, default=None, help='images dir or video for batched images/s')
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[1, 2, 4, 8], help='batch sizes for --batch-source')
     opt = parser.parse_args()
     opt.data = check_yaml(opt.data)  # check YAML
     print_args(vars(opt))
@@ -161,7 +203,12 @@ def parse_opt():
 
 
 def main(opt):
-    test(**vars(opt)) if opt.test else run(**vars(opt))
+    batch_source, batch_sizes = opt.batch_source, opt.batch_sizes
+    del opt.batch_source, opt.batch_sizes
+    if batch_source:
+        batch_throughput(opt.weights, batch_source, opt.imgsz, batch_sizes, opt.device, opt.half)
+    else:
+        test(**vars(opt)) if opt.test else run(**vars(opt))
 
 
 if __name__ == '__main__':
@@ -29,11 +29,15 @@ Usage - formats:
 """
 
 import argparse
+import itertools
 import os
 import platform
+import queue
 import sys
+import threading
 from pathlib import Path
 
+import numpy as np
 import torch
 
 FILE = Path(__file__).resolve()
@@ -42,35 +46,22 @@ if str(ROOT) not in sys.path:
     sys.path.append(str(ROOT))  # add ROOT to PATH
 ROOT = Path(os.path.relpath(ROOT, Path.cwd()))  # relative
 
-from models.common import DetectMultiBackend
+from utils.augmentations import letterbox
 from utils.dataloaders import IMG_FORMATS, VID_FORMATS, LoadImages, LoadScreenshots, LoadStreams
 from utils.general import (LOGGER, Profile, check_file, check_img_size, check_imshow, check_requirements, colorstr, cv2,
                            increment_path, non_max_suppression, print_args, scale_boxes, strip_optimizer, xyxy2xywh)
 from utils.plots import Annotator, colors, save_one_box
-from utils.torch_utils import select_device, smart_inference_mode
+from utils.torch_utils import smart_inference_mode
 
-from classes.bounding_box import BoundingBox
-import json
+from classes.bounding_box import assign_to_buses
+from classes.label_stabiliser import LabelStabiliser
+from classes.model_registry import model_registry
+from classes.result_store import ResultStore
+from classes.speech_queue import SpeechQueue
 
 import time
-import pyttsx3
-import threading
-
 
 
-def say(text: str) -> None:
-    """
-    Speak out text and print that text to the console.
-    """
-    # Setting up text to speech
-    voice_engine = pyttsx3.init()
-    speaking_rate = voice_engine.getProperty("rate")
-    #print(speaking_rate)
-    voice_engine.setProperty("rate", 150)
-    voice_engine.say(text)
-    print("'{}' being spoken".format(text))
-    voice_engine.runAndWait()
-
 def readable_bus(busnumber): # Turns into properly read format (letters with numbers does not sound correct)
     new_string = ""
     for char in busnumber: # Splitting bus with letters in them so it is read correctly
@@ -83,6 +74,164 @@ def readable_bus(busnumber): # Turns into properly read format (letters with num
     return new_string
 
 
+NUMBER, BUS, LIGHT, SIGNAL = 0, 1, 2, 3  # label groups, SIGNAL is a traffic light of unknown colour
+
+
+def class_groups(names, device='cpu'):
+    # Label group of every class id (-1 for other classes): bus numbers (any digit in the name), buses, lights
+    names = names if isinstance(names, dict) else dict(enumerate(names))
+    groups = torch.full((max(names) + 1,), -1, dtype=torch.long)
+    for i, name in names.items():
+        if any(char.isdigit() for char in name):
+            groups[i] = NUMBER
+        elif name == "bus":
+            groups[i] = BUS
+        elif name in ("green-traffic", "red-traffic"):
+            groups[i] = LIGHT
+        elif name == "traffic-light":
+            groups[i] = SIGNAL
+    return groups.to(device)
+
+
+def route_gains(names, groups, expected, gains=(1.25, 0.5)):
+    # Per-class score gain from the routes expected at the bus stop: gains[0] for expected route numbers,
+    # gains[1] for the other route numbers (0 drops them in NMS) and 1 for classes that are not route numbers
+    names = names if isinstance(names, dict) else dict(enumerate(names))
+    expected = {str(route).upper() for route in expected}
+    gain = torch.ones(len(groups), device=groups.device)
+    for i, name in names.items():
+        if groups[i] == NUMBER:
+            gain[i] = gains[0] if name.upper() in expected else gains[1]
+    return gain
+
+
+def apply_prior(pred, gain):
+    # Re-weight the class scores of a raw (b, n, 5 + nc) prediction in place, before NMS thresholds them
+    p = pred[0] if isinstance(pred, (list, tuple)) else pred
+    p[..., 5:] = (p[..., 5:] * gain).clamp_(max=1)
+    return pred
+
+
+def roi_region(det, groups, shape, margin=0.1, max_area=0.8):
+    # Expanded union (x1, y1, x2, y2) of bus and traffic light boxes in a det already scaled to an image of shape,
+    # None when there are no candidates or the region covers most of the image anyway
+    cand = det[groups[det[:, 5].long()] >= BUS, :4]
+    if not len(cand):
+        return None
+    x1, y1 = cand[:, 0].min(), cand[:, 1].min()
+    x2, y2 = cand[:, 2].max(), cand[:, 3].max()
+    mx, my = (x2 - x1) * margin, (y2 - y1) * margin
+    h, w = shape[:2]
+    x1, y1 = int(max(x1 - mx, 0)), int(max(y1 - my, 0))
+    x2, y2 = int(min(x2 + mx, w)), int(min(y2 + my, h))
+    if x2 <= x1 or y2 <= y1 or (x2 - x1) * (y2 - y1) > max_area * w * h:
+        return None
+    return x1, y1, x2, y2
+
+
+def group_labels(det, groups, names, bus_min_conf=0.2, orphan_min_conf=0.5, light_min_conf=0.7):
+    # Finalised traffic light and bus numbers of one image's det (n, 6) tensor, numbers ordered left to right
+    lbl_raw = {'light': '', 'number': []}
+    group = groups[det[:, 5].long()]
+
+    # Bus numbers, each assigned to its containing or nearest bus. A number on a bus needs less confidence
+    # than an orphan number, and only the most confident number per physical bus is reported
+    nums, buses = det[group == NUMBER], det[group == BUS]
+    if len(nums):
+        bus_idx = assign_to_buses(buses[:, :4], nums[:, :4])
+        on_bus = bus_idx >= 0
+        min_conf = torch.full_like(nums[:, 4], orphan_min_conf).masked_fill_(on_bus, bus_min_conf)
+        keep = nums[:, 4] > min_conf
+        nums, bus_idx, on_bus = nums[keep], bus_idx[keep], on_bus[keep]
+    if len(nums):
+        unit = torch.where(on_bus, bus_idx, len(buses) + nums[:, 5].long())  # physical bus, or class for orphans
+        order = (unit.float() * 2 - nums[:, 4]).argsort()  # by unit, most confident first
+        nums, unit, bus_idx, on_bus = nums[order], unit[order], bus_idx[order], on_bus[order]
+        first = torch.ones(len(nums), dtype=torch.bool, device=det.device)
+        first[1:] = unit[1:] != unit[:-1]
+        nums, bus_idx, on_bus = nums[first], bus_idx[first], on_bus[first]
+        x = torch.where(on_bus, buses[bus_idx.clamp(min=0), 0] if len(buses) else nums[:, 0], nums[:, 0])
+        nums = nums[x.argsort()]  # left to right by bus (or number) x-coordinate
+        lbl_raw['number'] = list(dict.fromkeys(names[int(c)] for c in nums[:, 5]))  # same route on two buses once
+
+    # Pedestrian lights, can only report the most confident one
+    lights = det[group == LIGHT]
+    if len(lights):
+        j = lights[:, 4].argmax()
+        if lights[j, 4] > light_min_conf:
+            lbl_raw['light'] = names[int(lights[j, 5])]
+    return lbl_raw
+
+
+class _PipelineError:
+    # Carries an exception raised in a pipeline stage to the consuming thread
+    def __init__(self, error):
+        self.error = error
+
+
+_DONE = object()  # end of pipeline marker
+
+
+def pipelined(items, stages, maxsize=2):
+    # Run items through stages with each stage on its own thread, connected by bounded queues, and yield
+    # the results of the last stage. Throughput approaches the slowest stage rather than the sum of all stages
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=maxsize) for _ in stages]
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def worker(k, stage):
+        source = iter(items) if k == 0 else iter(lambda: get(queues[k - 1]), _DONE)
+        try:
+            for item in source:
+                put(queues[k], item if isinstance(item, _PipelineError) else stage(item))
+        except Exception as e:
+            put(queues[k], _PipelineError(e))
+        put(queues[k], _DONE)
+
+    threads = [threading.Thread(target=worker, args=(k, stage), daemon=True) for k, stage in enumerate(stages)]
+    for t in threads:
+        t.start()
+    try:
+        for item in iter(lambda: get(queues[-1]), _DONE):
+            if isinstance(item, _PipelineError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()  # also unblocks the stage threads when the consumer stops early
+        for t in threads:
+            t.join(timeout=5)
+
+
+def fastload_mode(fastload, roi=False):
+    # TorchScript traces are fixed to one input size, the roi loop runs at roi_imgsz and imgsz so it loads fused
+    if fastload == 'torchscript' and roi:
+        LOGGER.warning("WARNING ⚠️ fastload='torchscript' cannot run the roi pass at a second size, using 'fused'")
+        return 'fused'
+    return fastload
+
+
+def load_model(weights, device='', dnn=False, data=ROOT / 'data/coco128.yaml', half=False, autobackend=False,
+               imgsz=(640, 640), fastload=False):
+    # Load a DetectMultiBackend model through the process-wide registry so it can be reused across runs
+    return model_registry.get(weights, device=device, dnn=dnn, data=data, half=half, autobackend=autobackend,
+                              imgsz=imgsz, fastload=fastload)
+
+
 @smart_inference_mode()
 def run(
         weights=ROOT / 'yolov5s.pt',  # model path or triton URL
@@ -112,6 +261,20 @@ def run(
         half=False,  # use FP16 half-precision inference
         dnn=False,  # use OpenCV DNN for ONNX inference
         vid_stride=1,  # video frame-rate stride
+        model=None,  # preloaded DetectMultiBackend, i.e. from DetectionService
+        stop_event=None,  # threading.Event, stop the loop when set
+        result_store=None,  # classes.result_store.ResultStore, defaults to a live_data/output_labels.json snapshot
+        stabiliser=None,  # classes.label_stabiliser.LabelStabiliser, temporal smoothing of labels
+        speech=None,  # classes.speech_queue.SpeechQueue, non-blocking announcements
+        stats=None,  # dict, kept up to date with stream frame counters (captured, dropped, processed)
+        pipeline=False,  # run pre-process, inference and post-process as overlapping stages
+        roi=False,  # adaptive resolution: low-res pass on the full frame, imgsz pass on bus/traffic light regions
+        roi_imgsz=320,  # low-res pass inference size (pixels) when roi=True
+        expected_routes=None,  # callable returning the route numbers expected at the bus stop, None if unknown
+        prior_gains=(1.25, 0.5),  # score gains for expected and unexpected route numbers, (1, 0) keeps expected only
+        autobackend=False,  # on CPU, load the fastest of PyTorch, ONNX Runtime and OpenVINO for .pt weights
+        fastload=False,  # 'fused' or 'torchscript', load a pre-built artifact saved next to .pt weights
+        profiler=None,  # classes.startup_profiler.StartupProfiler, marks the first processed frame
 ):
     source = str(source)
     save_img = not nosave and not source.endswith('.txt')  # save inference images
@@ -127,274 +290,249 @@ def run(
     (save_dir / 'labels' if save_txt else save_dir).mkdir(parents=True, exist_ok=True)  # make dir
 
     # Load model
-    device = select_device(device)
-    model = DetectMultiBackend(weights, device=device, dnn=dnn, data=data, fp16=half)
+    warm = model is not None  # preloaded models are already warm
+    fastload = fastload_mode(fastload, roi)
+    if not warm:
+        model = load_model(weights, device=device, dnn=dnn, data=data, half=half, autobackend=autobackend,
+                           imgsz=imgsz, fastload=fastload)
     stride, names, pt = model.stride, model.names, model.pt
     imgsz = check_img_size(imgsz, s=stride)  # check image size
+    load_imgsz = check_img_size(roi_imgsz, s=stride) if roi else imgsz  # frames are letterboxed for the first pass
 
     # Dataloader
     bs = 1  # batch_size
     if webcam:
         view_img = check_imshow(warn=True)
-        dataset = LoadStreams(source, img_size=imgsz, stride=stride, auto=pt, vid_stride=vid_stride)
+        dataset = LoadStreams(source, img_size=load_imgsz, stride=stride, auto=pt, vid_stride=vid_stride, latest=True)
         bs = len(dataset)
     elif screenshot:
-        dataset = LoadScreenshots(source, img_size=imgsz, stride=stride, auto=pt)
+        dataset = LoadScreenshots(source, img_size=load_imgsz, stride=stride, auto=pt)
     else:
-        dataset = LoadImages(source, img_size=imgsz, stride=stride, auto=pt, vid_stride=vid_stride)
+        dataset = LoadImages(source, img_size=load_imgsz, stride=stride, auto=pt, vid_stride=vid_stride)
     vid_path, vid_writer = [None] * bs, [None] * bs
 
 
     # Defined variable
-    frame_count = [] # Used for keeping track of frames with detected objects
+    groups = class_groups(names, device=model.device)  # label group per class id, computed once
+    if stabiliser is None:
+        stabiliser = LabelStabiliser()
+    if speech is None:
+        speech = SpeechQueue()
+    if result_store is None:
+        result_store = ResultStore(snapshot_path='live_data/output_labels.json')
+    prior = {'routes': None, 'gain': None}  # expected routes and their class gains, updated when the routes change
+
+    def update_prior():
+        routes = expected_routes() if expected_routes is not None else None
+        if routes is None:
+            prior['routes'], prior['gain'] = None, None
+        elif tuple(routes) != prior['routes']:
+            prior['routes'] = tuple(routes)
+            prior['gain'] = route_gains(names, groups, routes, prior_gains)
+            LOGGER.info(f'Expected routes: {", ".join(routes) or "none"}')
+        return prior['gain']
 
     # Run inference
-    model.warmup(imgsz=(1 if pt or model.triton else bs, 3, *imgsz))  # warmup
-    seen, windows, dt = 0, [], (Profile(), Profile(), Profile())
-    for path, im, im0s, vid_cap, s in dataset:
+    if not warm:
+        model.warmup(imgsz=(1 if pt or model.triton else bs, 3, *imgsz))  # warmup
+    seen, windows = 0, []
+    dt = tuple(Profile(hist=True) for _ in range(4))  # pre-process, inference, NMS, post-process
+
+    def preprocess(item):
+        path, im, im0s, vid_cap, s = item
         with dt[0]:
             im = torch.from_numpy(im).to(model.device)
             im = im.half() if model.fp16 else im.float()  # uint8 to fp16/32
             im /= 255  # 0 - 255 to 0.0 - 1.0
             if len(im.shape) == 3:
                 im = im[None]  # expand for batch dim
+        return path, im, im0s, vid_cap, s
 
+    def inference(item):
+        path, im, im0s, vid_cap, s = item
         # Inference
         with dt[1]:
-            visualize = increment_path(save_dir / Path(path).stem, mkdir=True) if visualize else False
-            pred = model(im, augment=augment, visualize=visualize)
+            vis = increment_path(save_dir / Path(path).stem, mkdir=True) if visualize else False
+            pred = model(im, augment=augment, visualize=vis)
 
-        # NMS
+        # NMS, route numbers re-weighted by the routes expected at the bus stop
         with dt[2]:
+            gain = update_prior()
+            if gain is not None:
+                apply_prior(pred, gain)
             pred = non_max_suppression(pred, conf_thres, iou_thres, classes, agnostic_nms, max_det=max_det)
-
-        # Second-stage classifier (optional)
-        # pred = utils.general.apply_classifier(pred, classifier_model, im, im0s)
-
-        # Process predictions
-        for i, det in enumerate(pred):  # per image
-            seen += 1
-            if webcam:  # batch_size >= 1
-                p, im0, frame = path[i], im0s[i].copy(), dataset.count
-                s += f'{i}: '
-            else:
-                p, im0, frame = path, im0s.copy(), getattr(dataset, 'frame', 0)
-
-            p = Path(p)  # to Path
-            save_path = str(save_dir / p.name)  # im.jpg
-            txt_path = str(save_dir / 'labels' / p.stem) + ('' if dataset.mode == 'image' else f'_{frame}')  # im.txt
-            s += '%gx%g ' % im.shape[2:]  # print string
-            gn = torch.tensor(im0.shape)[[1, 0, 1, 0]]  # normalization gain whwh
-            imc = im0.copy() if save_crop else im0  # for save_crop
-            annotator = Annotator(im0, line_width=line_thickness, example=str(names))
-
-            lbl_raw = {         # Contains String of finalised traffic light and bus numbers
-                'light': '',
-                'number': []
-            }
-
-            if len(det):
-                # Rescale boxes from img_size to im0 size
-                det[:, :4] = scale_boxes(im.shape[2:], det[:, :4], im0.shape).round()
-
-                # Print results
-                for c in det[:, 5].unique():
-                    n = (det[:, 5] == c).sum()  # detections per class
-                    s += f"{n} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
-
-                # [WK] Defined Lists
-                bb_nums = []        # Contains list of BoundingBox object of bus numbers
-                bb_bus = []         # Contains list of BoundingBox object of buses
-                bb_lights = []      # Contains list of BoundingBox object of pedestrian lights
-                
-
-                # Write results
-                for *xyxy, conf, cls in reversed(det):
-                    # Creating BoundingBox object
-                    bb = BoundingBox(names[int(cls)], conf, xyxy)
-                    #if bb.get_label().isdigit() == True:
-                    if any(char.isdigit() for char in bb.get_label()) == True: #checks if theres any digits within the label (means its a bus number)
-                        bb_nums.append(bb)
-                    elif bb.get_label() == "bus":
-                        bb_bus.append(bb)
-                    elif bb.get_label() == "green-traffic" or bb.get_label() == "red-traffic":
-                        bb_lights.append(bb)
-
-                    if save_txt:  # Write to file
-                        xywh = (xyxy2xywh(torch.tensor(xyxy).view(1, 4)) / gn).view(-1).tolist()  # normalized xywh
-                        line = (cls, *xywh, conf) if save_conf else (cls, *xywh)  # label format
-                        with open(f'{txt_path}.txt', 'a') as f:
-                            f.write(('%g ' * len(line)).rstrip() % line + '\n')
-
-                    if save_img or save_crop or view_img:  # Add bbox to image
-                        c = int(cls)  # integer class
-                        label = None if hide_labels else (names[c] if hide_conf else f'{names[c]} {conf:.2f}')
-                        annotator.box_label(xyxy, label, color=colors(c, True))
-                    if save_crop:
-                        save_one_box(xyxy, imc, file=save_dir / 'crops' / names[c] / f'{p.stem}.jpg', BGR=True)
-
-                # Sorting bus numbers based on x-coordinate
-                bb_nums = sorted(bb_nums, key=lambda b: b.get_x1())
-                num_confs = {}
-
-                light_confs = {}
-                bus_min_conf = 0.2
-                light_min_conf = 0.7
-
-
-
-                # If no bus is detected --> requires higher confidence threshold
-                if len(bb_bus) == 0:
-                    bus_min_conf = 0.5
-                    
-                temp_bus = []
-                for num in bb_nums:
-                    temp_bus.append(num.get_label())
-                    num_confs[num.get_label()] = num.get_conf()
-
-                # Check if something is detected
-                if len(temp_bus) > 0:
-                    # Check which number has highest confidence
-                    for busnumber in num_confs:
-                        print("confidence level of {}: {}".format(busnumber, num_confs[busnumber])) 
-                        if num_confs[busnumber] > bus_min_conf:
-                            lbl_raw['number'].append(busnumber)
-                if len(bb_lights) > 0:
-                    # Can only print one pedestrian light
-                    for light in bb_lights:
-                        print("confidence level of {}: {}".format(light, light.get_conf())) 
-                        light_confs[light.get_label()] = light.get_conf()
-                    
-                    final_light = max(light_confs) # Gets most confident
-                    if light_confs[final_light] > light_min_conf:
-                        lbl_raw['light'] = final_light         
-
-
-            # Defined variables
-            frame_threshold = 15 # Will be used for determining when a number is updated
-            # will check frame_count reaches frame_threshold before updating
-            # read the .json file to check if theres already any number, if there is and a new number is detected
-            # then will check with the 
-            
-            current_datetime = int( time.time_ns() / (1000)**3 ) # stored in Unix timestamp, number of secs since Jan 1 1970
-            update_check = False
-            raw_dict = {}
-            current_labels = {}
-
-            import traceback
-            try:
-                with open('live_data/raw_labels.json', 'r') as json_file:
-                    raw_dict = json.load(json_file)
-                    print('THE JSON DICT IS', raw_dict)
-            except Exception as e:
-                traceback.print_exc()
-                #print('Error opening raw labels,', e)
-
-            if raw_dict != None:
-                current_labels = raw_dict['label']
-            
-            if lbl_raw == current_labels:
-                if len(frame_count) == 0:
-                    frame_count.append(lbl_raw)
-                elif len(frame_count) == frame_threshold:
-                    #has been same frame long enough, will update
-                    update_check = True
-                    frame_count = []
-                else:
-                    if frame_count[-1] == lbl_raw:
-                        frame_count.append(lbl_raw)
-                    else:
-                        # Reset frame count, may be sudden anomaly detection
-                        frame_count = []
-
-            # If pedestrian light, will skip this, needs real time announcing
-            if lbl_raw['light']:
-                update_check = True
-
-            print("New Frame count:", frame_count)
-                
-            print("Label Raw:", lbl_raw['number'])
-            print(lbl_raw['number'], 'has ', update_check)
-
-            # Outputting results to json
-
-            lbl_data = {
-                'label': lbl_raw,
-                'update': update_check,
-                'last_updated': current_datetime
-            }
-
-            voiced_text = ""
-
-            if update_check == True and (lbl_raw['light'] or lbl_raw['number']):
-                if lbl_raw['light']:
-                    pedestrian_light = lbl_raw['light']
-                    if pedestrian_light == "green-traffic":
-                        voiced_text = "Green"
-                    elif pedestrian_light == "red-traffic":
-                        voiced_text = "Red"
-                    if lbl_raw['number']:
-                        # Connect
-                        voiced_text += " and "
-                if lbl_raw['number']:
-                    bus_list = lbl_raw['number']
-                    if len(bus_list) > 1:
-                        for j in range(len(bus_list)):
-                            bus = bus_list[j]
-                            voiced_text = voiced_text + " " + readable_bus(bus)
-                            if j < len(bus_list)-1:
-                                voiced_text += " and "
+        if roi:
+            for i, det in enumerate(pred):
+                pred[i] = refine_roi(det, im.shape[2:], im0s[i] if webcam else im0s, gain)
+        return path, im, im0s, vid_cap, s, pred
+
+    def refine_roi(det, shape, im0, gain=None):
+        # Rescale the low-res det to im0 and re-run at imgsz on the bus/traffic light region to read route numbers
+        det[:, :4] = scale_boxes(shape, det[:, :4], im0.shape).round()
+        region = roi_region(det, groups, im0.shape)
+        if region is None:  # no candidates, stay at low resolution
+            return det
+        x1, y1, x2, y2 = region
+        crop = im0[y1:y2, x1:x2]
+        with dt[1]:
+            im = letterbox(crop, imgsz, stride=stride, auto=pt)[0].transpose((2, 0, 1))[::-1]  # HWC to CHW, BGR to RGB
+            im = torch.from_numpy(np.ascontiguousarray(im)).to(model.device)
+            im = (im.half() if model.fp16 else im.float())[None] / 255
+            crop_pred = model(im, augment=augment)
+        with dt[2]:
+            if gain is not None:
+                apply_prior(crop_pred, gain)
+            crop_det = non_max_suppression(crop_pred, conf_thres, iou_thres, classes, agnostic_nms, max_det=max_det)[0]
+        crop_det[:, :4] = scale_boxes(im.shape[2:], crop_det[:, :4], crop.shape).round()
+        crop_det[:, [0, 2]] += x1
+        crop_det[:, [1, 3]] += y1
+        cx, cy = (det[:, 0] + det[:, 2]) / 2, (det[:, 1] + det[:, 3]) / 2
+        outside = (cx < x1) | (cx > x2) | (cy < y1) | (cy > y2)
+        return torch.cat((crop_det, det[outside]), 0)  # high-res detections replace low-res ones in the region
+
+    frames = itertools.takewhile(lambda _: stop_event is None or not stop_event.is_set(), dataset)
+    if pipeline:  # capture + pre-process, inference + NMS and post-process overlap on separate threads
+        results = pipelined(frames, [smart_inference_mode()(preprocess), smart_inference_mode()(inference)])
+    else:
+        results = (inference(preprocess(item)) for item in frames)
+    try:
+        for path, im, im0s, vid_cap, s, pred in results:
+            # Second-stage classifier (optional)
+            # pred = utils.general.apply_classifier(pred, classifier_model, im, im0s)
+
+            # Process predictions
+            with dt[3]:
+                for i, det in enumerate(pred):  # per image
+                    seen += 1
+                    if webcam:  # batch_size >= 1
+                        p, im0, frame = path[i], im0s[i].copy(), dataset.count
+                        s += f'{i}: '
                     else:
-                        voiced_text = voiced_text + " " + readable_bus(bus_list[0])
-                threading.Thread(
-                    target=say, args=(voiced_text,), daemon=True
-                ).start()
-
-            try:
-                json_file = open("live_data/output_labels.json", "w")
-                json.dump(lbl_data, json_file)
-
-                json_file = open("live_data/raw_labels.json", "w")
-                json.dump(lbl_data, json_file)
-            except Exception as e:
-                traceback.print_exc()
-
-
-            # Stream results
-            im0 = annotator.result()
-            if view_img:
-                if platform.system() == 'Linux' and p not in windows:
-                    windows.append(p)
-                    cv2.namedWindow(str(p), cv2.WINDOW_NORMAL | cv2.WINDOW_KEEPRATIO)  # allow window resize (Linux)
-                    cv2.resizeWindow(str(p), im0.shape[1], im0.shape[0])
-                cv2.imshow(str(p), im0)
-                cv2.waitKey(1)  # 1 millisecond
-
-            # Save results (image with detections)
-            if save_img:
-                if dataset.mode == 'image':
-                    cv2.imwrite(save_path, im0)
-                else:  # 'video' or 'stream'
-                    if vid_path[i] != save_path:  # new video
-                        vid_path[i] = save_path
-                        if isinstance(vid_writer[i], cv2.VideoWriter):
-                            vid_writer[i].release()  # release previous video writer
-                        if vid_cap:  # video
-                            fps = vid_cap.get(cv2.CAP_PROP_FPS)
-                            w = int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                            h = int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                        else:  # stream
-                            fps, w, h = 30, im0.shape[1], im0.shape[0]
-                        save_path = str(Path(save_path).with_suffix('.mp4'))  # force *.mp4 suffix on results test_data
-                        vid_writer[i] = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
-                    vid_writer[i].write(im0)
-
-        # Print time (inference-only)
-        LOGGER.info(f"{s}{'' if len(det) else '(no detections), '}{dt[1].dt * 1E3:.1f}ms")
+                        p, im0, frame = path, im0s.copy(), getattr(dataset, 'frame', 0)
+
+                    p = Path(p)  # to Path
+                    save_path = str(save_dir / p.name)  # im.jpg
+                    txt_path = str(save_dir / 'labels' / p.stem) + ('' if dataset.mode == 'image' else f'_{frame}')  # im.txt
+                    s += '%gx%g ' % im.shape[2:]  # print string
+                    gn = torch.tensor(im0.shape)[[1, 0, 1, 0]]  # normalization gain whwh
+                    imc = im0.copy() if save_crop else im0  # for save_crop
+                    annotator = Annotator(im0, line_width=line_thickness, example=str(names))
+
+                    lbl_raw = {         # Contains String of finalised traffic light and bus numbers
+                        'light': '',
+                        'number': []
+                    }
+
+                    if len(det):
+                        # Rescale boxes from img_size to im0 size (already done by the roi pass)
+                        if not roi:
+                            det[:, :4] = scale_boxes(im.shape[2:], det[:, :4], im0.shape).round()
+
+                        # Print results
+                        for c in det[:, 5].unique():
+                            n = (det[:, 5] == c).sum()  # detections per class
+                            s += f"{n} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
+
+                        # [WK] Bus numbers, buses and pedestrian lights grouped on the det tensor
+                        lbl_raw = group_labels(det, groups, names)
+
+                        # Write results
+                        if save_txt or save_img or save_crop or view_img:
+                            for *xyxy, conf, cls in reversed(det):
+                                if save_txt:  # Write to file
+                                    xywh = (xyxy2xywh(torch.tensor(xyxy).view(1, 4)) / gn).view(-1).tolist()  # normalized xywh
+                                    line = (cls, *xywh, conf) if save_conf else (cls, *xywh)  # label format
+                                    with open(f'{txt_path}.txt', 'a') as f:
+                                        f.write(('%g ' * len(line)).rstrip() % line + '\n')
+
+                                if save_img or save_crop or view_img:  # Add bbox to image
+                                    c = int(cls)  # integer class
+                                    label = None if hide_labels else (names[c] if hide_conf else f'{names[c]} {conf:.2f}')
+                                    annotator.box_label(xyxy, label, color=colors(c, True))
+                                if save_crop:
+                                    save_one_box(xyxy, imc, file=save_dir / 'crops' / names[c] / f'{p.stem}.jpg', BGR=True)
+
+                    current_datetime = int( time.time_ns() / (1000)**3 ) # stored in Unix timestamp, number of secs since Jan 1 1970
+
+                    # Smooth over recent frames, traffic lights settle within a few frames, bus numbers take longer
+                    lbl_stable, update_check = stabiliser.update(lbl_raw, expected=prior['routes'])
+
+                    print("Label Raw:", lbl_raw['number'])
+                    print(lbl_stable['number'], 'has ', update_check)
+
+                    # Publishing results to the result store
+
+                    lbl_data = {
+                        'label': lbl_stable,
+                        'update': update_check,
+                        'last_updated': current_datetime
+                    }
+
+                    # Traffic lights and bus numbers are queued separately so a light change is spoken first
+                    if update_check == True and (lbl_stable['light'] or lbl_stable['number']):
+                        if lbl_stable['light']:
+                            pedestrian_light = lbl_stable['light']
+                            if pedestrian_light == "green-traffic":
+                                speech.say("Green", priority=SpeechQueue.LIGHT)
+                            elif pedestrian_light == "red-traffic":
+                                speech.say("Red", priority=SpeechQueue.LIGHT)
+                        if lbl_stable['number']:
+                            voiced_text = " and ".join(readable_bus(bus) for bus in lbl_stable['number'])
+                            speech.say(voiced_text, priority=SpeechQueue.BUS)
+
+                    result_store.publish(lbl_data)
+
+
+                    # Stream results
+                    im0 = annotator.result()
+                    if view_img:
+                        if platform.system() == 'Linux' and p not in windows:
+                            windows.append(p)
+                            cv2.namedWindow(str(p), cv2.WINDOW_NORMAL | cv2.WINDOW_KEEPRATIO)  # allow window resize (Linux)
+                            cv2.resizeWindow(str(p), im0.shape[1], im0.shape[0])
+                        cv2.imshow(str(p), im0)
+                        cv2.waitKey(1)  # 1 millisecond
+
+                    # Save results (image with detections)
+                    if save_img:
+                        if dataset.mode == 'image':
+                            cv2.imwrite(save_path, im0)
+                        else:  # 'video' or 'stream'
+                            if vid_path[i] != save_path:  # new video
+                                vid_path[i] = save_path
+                                if isinstance(vid_writer[i], cv2.VideoWriter):
+                                    vid_writer[i].release()  # release previous video writer
+                                if vid_cap:  # video
+                                    fps = vid_cap.get(cv2.CAP_PROP_FPS)
+                                    w = int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                                    h = int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                                else:  # stream
+                                    fps, w, h = 30, im0.shape[1], im0.shape[0]
+                                save_path = str(Path(save_path).with_suffix('.mp4'))  # force *.mp4 suffix on results test_data
+                                vid_writer[i] = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+                            vid_writer[i].write(im0)
+
+            # Print time (inference-only)
+            LOGGER.info(f"{s}{'' if len(det) else '(no detections), '}{dt[1].dt * 1E3:.1f}ms")
+            if profiler is not None:
+                profiler.mark('first_frame')
+            if webcam and stats is not None:
+                stats.update(dataset.stats())
+    finally:  # release the camera and pipeline threads even if a frame raised, the Flask process lives on
+        results.close()
+        if webcam:
+            counts = dataset.stats()
+            LOGGER.info(f"Frames: {sum(counts['captured'])} captured, {sum(counts['dropped'])} dropped, "
+                        f"{sum(counts['processed'])} processed")
+            dataset.close()  # release camera
 
     # Print results
-    t = tuple(x.t / seen * 1E3 for x in dt)  # speeds per image
-    LOGGER.info(f'Speed: %.1fms pre-process, %.1fms inference, %.1fms NMS per image at shape {(1, 3, *imgsz)}' % t)
+    t = tuple(x.t / max(seen, 1) * 1E3 for x in dt)  # speeds per image
+    LOGGER.info(f'Speed: %.1fms pre-process, %.1fms inference, %.1fms NMS, %.1fms post-process per image at shape '
+                f'{(1, 3, *imgsz)}' % t)
+    for k, x in zip(('pre-process', 'inference', 'NMS', 'post-process'), dt):
+        LOGGER.info(f'Latency {k}: p50 <= {x.percentile(50) * 1E3:g}ms, p90 <= {x.percentile(90) * 1E3:g}ms, '
+                    f'p99 <= {x.percentile(99) * 1E3:g}ms')
     if save_txt or save_img:
         s = f"\n{len(list(save_dir.glob('labels/*.txt')))} labels saved to {save_dir / 'labels'}" if save_txt else ''
         LOGGER.info(f"Results saved to {colorstr('bold', save_dir)}{s}")
@@ -431,6 +569,14 @@ def parse_opt():
     parser.add_argument('--half', action='store_true', help='use FP16 half-precision inference')
     parser.add_argument('--dnn', action='store_true', help='use OpenCV DNN for ONNX inference')
     parser.add_argument('--vid-stride', type=int, default=1, help='video frame-rate stride')
+    parser.add_argument('--pipeline', action='store_true', help='overlap pre-process, inference and post-process')
+    parser.add_argument('--roi', action='store_true', help='low-res full frame pass, high-res bus/traffic light regions')
+    parser.add_argument('--roi-imgsz', type=int, default=320, help='low-res pass inference size (pixels) with --roi')
+    parser.add_argument('--autobackend', action='store_true', help='CPU: use the fastest exported backend')
+    parser.add_argument('--fastload', type=str, default=False, choices=['fused', 'torchscript'],
+                        help='load a pre-fused or TorchScript artifact cached next to the weights')
+    parser.add_argument('--bus-stop', type=str, default=None, help='bus stop code, re-weight routes arriving there')
+    parser.add_argument('--prior-gains', nargs=2, type=float, default=[1.25, 0.5], help='expected, unexpected gains')
     opt = parser.parse_args()
     opt.imgsz *= 2 if len(opt.imgsz) == 1 else 1  # expand
     print_args(vars(opt))
@@ -439,6 +585,14 @@ def parse_opt():
 
 def main(opt):
     check_requirements(exclude=('tensorboard', 'thop'))
+    bus_stop = opt.bus_stop
+    del opt.bus_stop
+    if bus_stop:  # routes arriving within 3 minutes, kept fresh in the background (LTA_API_KEY)
+        from classes.lta_api import ArrivalService
+
+        arrivals = ArrivalService(os.getenv('LTA_API_KEY', ''))
+        arrivals.watch(bus_stop)
+        opt.expected_routes = lambda: arrivals.expected_services(bus_stop, cached=True)
     run(**vars(opt))
 
 
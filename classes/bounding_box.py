@@ -1,3 +1,8 @@
+import torch
+
+from utils.metrics import box_iou
+
+
 class BoundingBox:
     def __init__(self, label, conf, xyxy):
         self.__label = label
@@ -29,4 +34,29 @@ class BoundingBox:
 # Check if the number label is inside bus label
 def inside(bus, number):
     center_x, center_y = (number.get_x1() + number.get_x2()) / 2, (number.get_y1() + number.get_y2()) / 2
-    return bus.get_x1() <= center_x <= bus.get_x2() and bus.get_y1() <= center_y <= bus.get_y2()
\ No newline at end of file
+    return bus.get_x1() <= center_x <= bus.get_x2() and bus.get_y1() <= center_y <= bus.get_y2()
+
+# Vectorised inside() for tensors of xyxy boxes, returns (N_numbers, N_buses) bool matrix
+def inside_matrix(buses, numbers):
+    center_x = (numbers[:, 0] + numbers[:, 2]) / 2
+    center_y = (numbers[:, 1] + numbers[:, 3]) / 2
+    return ((buses[None, :, 0] <= center_x[:, None]) & (center_x[:, None] <= buses[None, :, 2]) &
+            (buses[None, :, 1] <= center_y[:, None]) & (center_y[:, None] <= buses[None, :, 3]))
+
+
+# Assign each number box to its containing or nearest bus box using an (N_numbers, N_buses) score matrix.
+# Containment ranks first, then IoU, then centre distance relative to the bus diagonal.
+# Returns the bus index per number, -1 for orphans (not inside, not overlapping and not near any bus)
+def assign_to_buses(buses, numbers, max_distance=1.0):
+    if len(buses) == 0:
+        return torch.full((len(numbers),), -1, dtype=torch.long, device=numbers.device)
+    contain = inside_matrix(buses, numbers).float()
+    iou = box_iou(numbers, buses)
+    centres_n = (numbers[:, :2] + numbers[:, 2:4]) / 2
+    centres_b = (buses[:, :2] + buses[:, 2:4]) / 2
+    diagonal = (buses[:, 2:4] - buses[:, :2]).norm(dim=1).clamp(min=1)
+    distance = (centres_n[:, None] - centres_b[None]).norm(dim=2) / diagonal[None]
+    score = 4 * contain + 2 * iou + (1 - distance / max_distance).clamp(min=0)
+    best_score, best = score.max(1)
+    best[best_score <= 0] = -1
+    return best
@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+from uuid import uuid4
+
+from werkzeug.utils import secure_filename
+
+from classes.file_index import sha256_file
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class ChunkedUploads:
+    """
+    Resumable uploads of large files in fixed-size chunks, streamed straight to a pre-sized part file.
+    Chunks can arrive in any order and in parallel since each one is written at its own offset through its own
+    file handle. Received chunk indices are kept in a small JSON file next to the part, so an interrupted upload
+    resumes after a restart. complete() checks the sha256 and moves the file into target_dir.
+    """
+
+    def __init__(self, target_dir, parts_dir, chunk_size=8 << 20, buffer_size=1 << 20, extensions=None,
+                 on_complete=None):
+        self.__target_dir = target_dir
+        self.__parts_dir = parts_dir
+        self.__chunk_size = chunk_size
+        self.__buffer_size = buffer_size  # bytes held in memory per request while streaming a chunk
+        self.__extensions = tuple(e.lower() for e in extensions) if extensions else None
+        self.__on_complete = on_complete  # fn(file_name), i.e. register the file in the uploads index
+        self.__lock = threading.Lock()
+        self.__sessions = {}
+        os.makedirs(parts_dir, exist_ok=True)
+        self.__load()
+
+    def init(self, file_name, size, sha256=None):
+        file_name = secure_filename(file_name or "")
+        if not file_name or size is None or int(size) < 0:
+            raise UploadError("file name and size are required")
+        if self.__extensions and not file_name.lower().endswith(self.__extensions):
+            raise UploadError(f"only {', '.join(self.__extensions)} files can be uploaded")
+        session = {
+            "id": uuid4().hex,
+            "file_name": file_name,
+            "size": int(size),
+            "sha256": sha256.lower() if sha256 else None,
+            "chunk_size": self.__chunk_size,
+            "received": []
+        }
+        with open(self.__part_path(session["id"]), "wb") as f:
+            f.truncate(session["size"])
+        with self.__lock:
+            self.__sessions[session["id"]] = session
+            self.__save(session)
+        return self.status(session["id"])
+
+    def write_chunk(self, upload_id, offset, stream):
+        # Streams one chunk from a file-like object to its offset, returns the upload status
+        session = self.__get(upload_id)
+        chunk_size, size = session["chunk_size"], session["size"]
+        if offset % chunk_size or not 0 <= offset < max(size, 1):
+            raise UploadError(f"offset must be a multiple of {chunk_size} below {size}")
+        expected = min(chunk_size, size - offset)
+        written = 0
+        with open(self.__part_path(upload_id), "r+b") as f:
+            f.seek(offset)
+            while written < expected:
+                data = stream.read(min(self.__buffer_size, expected - written))
+                if not data:
+                    break
+                f.write(data)
+                written += len(data)
+        if written != expected or stream.read(1):
+            raise UploadError(f"chunk at offset {offset} must be {expected} bytes")
+        with self.__lock:
+            index = offset // chunk_size
+            if index not in session["received"]:
+                session["received"].append(index)
+                self.__save(session)
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        session = self.__get(upload_id)
+        chunks = self.__chunks(session)
+        with self.__lock:
+            received = set(session["received"])
+        return {
+            "id": upload_id,
+            "file_name": session["file_name"],
+            "size": session["size"],
+            "chunk_size": session["chunk_size"],
+            "chunks": chunks,
+            "received": len(received),
+            "missing": [i * session["chunk_size"] for i in range(chunks) if i not in received]  # offsets
+        }
+
+    def complete(self, upload_id):
+        # Verifies and moves the finished file into target_dir, returns its file name
+        status = self.status(upload_id)
+        if status["missing"]:
+            raise UploadError(f"{len(status['missing'])} chunks missing", status=409)
+        session = self.__get(upload_id)
+        part_path = self.__part_path(upload_id)
+        if session["sha256"] and sha256_file(part_path) != session["sha256"]:
+            raise UploadError("sha256 mismatch, upload the file again", status=422)
+        file_name = unique_name(self.__target_dir, session["file_name"])
+        os.replace(part_path, os.path.join(self.__target_dir, file_name))
+        self.abort(upload_id)
+        if self.__on_complete:
+            self.__on_complete(file_name)
+        return file_name
+
+    def abort(self, upload_id):
+        with self.__lock:
+            self.__sessions.pop(upload_id, None)
+        for path in (self.__part_path(upload_id), self.__state_path(upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __get(self, upload_id):
+        with self.__lock:
+            session = self.__sessions.get(upload_id)
+        if session is None:
+            raise UploadError("Upload not found", status=404)
+        return session
+
+    @staticmethod
+    def __chunks(session):
+        return max(-(-session["size"] // session["chunk_size"]), 1)
+
+    def __part_path(self, upload_id):
+        return os.path.join(self.__parts_dir, f"{upload_id}.part")
+
+    def __state_path(self, upload_id):
+        return os.path.join(self.__parts_dir, f"{upload_id}.json")
+
+    def __load(self):
+        for name in os.listdir(self.__parts_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.__parts_dir, name), "r") as json_file:
+                    session = json.load(json_file)
+                if os.path.exists(self.__part_path(session["id"])):
+                    self.__sessions[session["id"]] = session
+            except (OSError, ValueError, KeyError) as e:
+                print('Error loading upload state,', e)
+
+    def __save(self, session):
+        tmp_path = f"{self.__state_path(session['id'])}.tmp"
+        with open(tmp_path, "w") as json_file:
+            json.dump(session, json_file)
+        os.replace(tmp_path, self.__state_path(session["id"]))
+
+
+def unique_name(directory, file_name):
+    # file.mp4, file_1.mp4, file_2.mp4, ... so an upload never overwrites an existing file
+    stem, suffix = os.path.splitext(file_name)
+    name, n = file_name, 0
+    while os.path.exists(os.path.join(directory, name)):
+        n += 1
+        name = f"{stem}_{n}{suffix}"
+    return name
@@ -1,4 +1,8 @@
 import datetime
+import functools
+import json
+import os
+import shutil
 import yaml
 
 now = datetime.datetime.now()
@@ -47,11 +51,7 @@ class COCO:
                              {"id": 3, "name": "980", "supercategory": "Numbers"},
                              {"id": 4, "name": "981", "supercategory": "Numbers"}]
         """
-        self.__categories = [{"id": 0, "name": "Numbers", "supercategory": "none"}]
-        categories = get_categories_yaml()
-        for i in range(len(categories)):
-            cat_obj = {"id": i + 1, "name": categories[i], "supercategory": "none"}
-            self.__categories.append(cat_obj)
+        self.__categories = get_categories()
         self.__images = images
         self.__annotations = annotations
 
@@ -108,6 +108,71 @@ class Annotation:
         return output
 
 
+class COCOWriter:
+    """
+    Incremental COCO exporter, each image and annotation record is serialised exactly once.
+    mode='per_image' writes one small COCO file next to every image (<stem>.json, the layout the Roboflow upload
+    expects), mode='single' streams records to part files and close() joins them into one COCO file.
+    """
+
+    def __init__(self, out_dir, mode="per_image", file_name="_annotations.coco.json"):
+        assert mode in ("per_image", "single"), f"unknown COCO writer mode {mode}"
+        self.__out_dir = out_dir
+        self.__mode = mode
+        self.__path = os.path.join(out_dir, file_name)
+        self.__image_count = 0
+        self.__label_count = 0
+        self.__images = None
+        self.__annotations = None
+        if mode == "single":
+            self.__images = open(self.__path + ".images.part", "w")
+            self.__annotations = open(self.__path + ".annotations.part", "w")
+
+    def add_image(self, file_name, height, width, labels):
+        # labels: list of (category_id, [x, y, w, h]), returns the image id
+        per_image = self.__mode == "per_image"
+        image_id = 0 if per_image else self.__image_count
+        label_id = 0 if per_image else self.__label_count
+        image = Image(image_id, file_name, height, width).return_json()
+        annotations = [Annotation(label_id + j, image_id, category_id, bbox).return_json()
+                       for j, (category_id, bbox) in enumerate(labels)]
+        if per_image:
+            stem = os.path.splitext(file_name)[0]
+            with open(os.path.join(self.__out_dir, stem + ".json"), "w") as outfile:
+                json.dump(COCO([image], annotations).return_json(), outfile)
+        else:
+            self.__append(self.__images, self.__image_count, [image])
+            self.__append(self.__annotations, self.__label_count, annotations)
+        self.__image_count += 1
+        self.__label_count += len(annotations)
+        return image_id
+
+    def close(self):
+        # Finalise the single COCO file, header first and then the streamed records
+        if self.__mode != "single" or self.__images is None:
+            return
+        self.__images.close()
+        self.__annotations.close()
+        header = COCO([], []).return_json()
+        with open(self.__path, "w") as outfile:
+            for key in ("info", "licenses", "categories"):
+                outfile.write(("{" if key == "info" else ", ") + f"{json.dumps(key)}: {json.dumps(header[key])}")
+            for key, part in (("images", self.__images), ("annotations", self.__annotations)):
+                outfile.write(f", {json.dumps(key)}: [")
+                with open(part.name, "r") as infile:
+                    shutil.copyfileobj(infile, outfile)
+                outfile.write("]")
+                os.remove(part.name)
+            outfile.write("}")
+        self.__images = self.__annotations = None
+
+    @staticmethod
+    def __append(part, count, records):
+        for j, record in enumerate(records):
+            part.write(("," if count + j else "") + json.dumps(record))
+
+
+@functools.lru_cache(maxsize=None)
 def get_categories_yaml():
     with open("data.yaml", "r") as stream:
         try:
@@ -117,4 +182,14 @@ def get_categories_yaml():
             print(exc)
 
 
+def get_categories():
+    # COCO categories from data.yaml, read once and copied per caller
+    categories = [{"id": 0, "name": "Numbers", "supercategory": "none"}]
+    names = get_categories_yaml()
+    for i in range(len(names)):
+        cat_obj = {"id": i + 1, "name": names[i], "supercategory": "none"}
+        categories.append(cat_obj)
+    return categories
+
+
 get_categories_yaml()
@@ -0,0 +1,98 @@
+import threading
+import time
+import traceback
+
+from classes.startup_profiler import lazy_import, startup_profiler
+
+bus_detection = lazy_import("bus_detection")  # torch and the YOLOv5 modules load with the first detection
+
+
+class DetectionService:
+    """
+    Long-lived bus detection worker owned by the Flask app.
+    The model is loaded once and stays warm across start/stop cycles, and at most one
+    detection loop runs at a time so repeated starts never fight over the camera.
+    """
+
+    def __init__(self, weights, source=0, **kwargs):
+        self.__weights = weights
+        self.__source = source
+        self.__kwargs = kwargs  # extra bus_detection.run() arguments, i.e. conf_thres
+        self.__run_kwargs = {}  # bus_detection.run() arguments of the current run only, i.e. expected_routes
+        self.__model = None
+        self.__thread = None
+        self.__stop_event = threading.Event()
+        self.__lock = threading.Lock()
+        self.__started_at = None
+        self.__error = None
+        self.__stats = {}  # stream frame counters, updated by bus_detection.run
+
+    def get_model(self):
+        # Load on first use, then reuse the same warm instance
+        if self.__model is None:
+            with startup_profiler.stage("load_model {}".format(self.__weights)):
+                model = bus_detection.load_model(self.__weights,
+                                                 device=self.__kwargs.get('device', ''),
+                                                 dnn=self.__kwargs.get('dnn', False),
+                                                 half=self.__kwargs.get('half', False),
+                                                 autobackend=self.__kwargs.get('autobackend', False),
+                                                 imgsz=self.__kwargs.get('imgsz', (640, 640)),
+                                                 fastload=bus_detection.fastload_mode(
+                                                     self.__kwargs.get('fastload', False),
+                                                     self.__kwargs.get('roi', False)))
+            with startup_profiler.stage("warmup {}".format(self.__weights)):
+                model.warmup(imgsz=(1, 3, *self.__kwargs.get('imgsz', (640, 640))))
+            self.__model = model
+        return self.__model
+
+    def is_running(self):
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def start(self, **run_kwargs):
+        # Returns False if detection is already running
+        with self.__lock:
+            if self.is_running():
+                return False
+            self.__run_kwargs = run_kwargs
+            self.__stop_event.clear()
+            self.__error = None
+            self.__stats = {}
+            self.__started_at = int(time.time())
+            self.__thread = threading.Thread(target=self.__run, daemon=True)
+            self.__thread.start()
+            return True
+
+    def stop(self, timeout=10):
+        # Returns False if detection was not running
+        with self.__lock:
+            if not self.is_running():
+                return False
+            self.__stop_event.set()
+            self.__thread.join(timeout=timeout)
+            return True
+
+    def get_status(self):
+        frames = {k: sum(v) for k, v in self.__stats.items()}
+        elapsed = time.time() - self.__started_at if self.__started_at else 0
+        return {
+            "running": self.is_running(),
+            "model_loaded": self.__model is not None,
+            "weights": str(self.__weights),
+            "source": str(self.__source),
+            "started_at": self.__started_at,
+            "error": self.__error,
+            "frames": frames,
+            "fps": round(frames.get("processed", 0) / elapsed, 2) if elapsed else 0.0
+        }
+
+    def __run(self):
+        try:
+            bus_detection.run(self.__weights, self.__source,
+                              model=self.get_model(),
+                              stop_event=self.__stop_event,
+                              stats=self.__stats,
+                              profiler=startup_profiler,
+                              **{**self.__kwargs, **self.__run_kwargs})
+        except Exception as e:
+            traceback.print_exc()
+            self.__error = str(e)
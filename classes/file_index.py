@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import threading
+
+from classes.startup_profiler import lazy_import
+
+cv2 = lazy_import("cv2")  # only needed to index new media files
+
+VIDEO_FORMATS = (".mp4", ".mov", ".avi", ".mkv")
+IMAGE_FORMATS = (".jpg", ".jpeg", ".png")
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def video_metadata(path):
+    cap = cv2.VideoCapture(path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        return {
+            "type": "video",
+            "frames": max(frames, 1),
+            "fps": round(fps, 2),
+            "duration": round(frames / fps, 2) if fps else None,
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        }
+    finally:
+        cap.release()
+
+
+def image_metadata(path):
+    im = cv2.imread(path)
+    h, w = im.shape[:2] if im is not None else (0, 0)
+    return {"type": "image", "frames": 1, "width": w, "height": h}
+
+
+def weights_metadata(path):
+    import torch  # only needed for .pt files
+
+    ckpt = torch.load(path, map_location="cpu")
+    model = ckpt["model"] if isinstance(ckpt, dict) else ckpt
+    names = getattr(model, "names", {})
+    opt = ckpt.get("opt", {}) if isinstance(ckpt, dict) else {}
+    return {
+        "type": "weights",
+        "classes": list(names.values()) if isinstance(names, dict) else list(names),
+        "parameters": sum(p.numel() for p in model.parameters()),
+        "imgsz": opt.get("imgsz"),
+        "sha256": sha256_file(path)
+    }
+
+
+def default_extractor(path):
+    name = path.lower()
+    if name.endswith(VIDEO_FORMATS):
+        return video_metadata(path)
+    if name.endswith(IMAGE_FORMATS):
+        return image_metadata(path)
+    if name.endswith(".pt"):
+        return weights_metadata(path)
+    if name.endswith(".onnx"):
+        return {"type": "weights", "sha256": sha256_file(path)}  # i.e. INT8 models from quantize.py
+    return {"type": "file"}
+
+
+class FileIndex:
+    """
+    Cached listing of a directory with per-file metadata, i.e. video frames and resolution or model classes.
+    Metadata is keyed by (mtime, size) and every list() stats the entries in one scandir pass, so only new or
+    changed files are read again, including files overwritten in place. Sub-directories are listed as one entry
+    with the totals of their files. The cache is kept in a JSON file so a restart does not re-read everything.
+    """
+
+    def __init__(self, root, extensions, cache_path=None, include_dirs=False, extractor=default_extractor):
+        self.__root = root
+        self.__extensions = tuple(e.lower() for e in extensions)
+        self.__cache_path = cache_path
+        self.__include_dirs = include_dirs
+        self.__extractor = extractor
+        self.__lock = threading.RLock()
+        self.__meta = {}  # relative path -> {"mtime", "size", "meta"}
+        self.__load()
+
+    def list(self):
+        # Returns [{"name", "size", "mtime", ...metadata}], sorted by name
+        with self.__lock:
+            return self.__scan()
+
+    def names(self):
+        return [entry["name"] for entry in self.list()]
+
+    def get(self, name):
+        # Metadata of one file or sub-directory, None if it is not in the index
+        return next((entry for entry in self.list() if entry["name"] == name), None)
+
+    def register(self, name):
+        # Index a file that was just written, i.e. a finished upload, so the next listing does not read it
+        with self.__lock:
+            self.__entry(name)
+            self.__save()
+
+    def __scan(self):
+        listing, changed = [], False
+        for entry in sorted(os.scandir(self.__root), key=lambda e: e.name):
+            if entry.is_dir():
+                if not self.__include_dirs:
+                    continue
+                files = []
+                for sub in sorted(os.scandir(entry.path), key=lambda e: e.name):
+                    if sub.is_file() and sub.name.lower().endswith(self.__extensions):
+                        item, updated = self.__entry(os.path.join(entry.name, sub.name), sub.stat())
+                        files.append(item)
+                        changed |= updated
+                listing.append(directory_entry(entry.name, files))
+            elif entry.name.lower().endswith(self.__extensions):
+                item, updated = self.__entry(entry.name, entry.stat())
+                listing.append(item)
+                changed |= updated
+        if changed:
+            self.__save()
+        return listing
+
+    def __entry(self, name, st=None):
+        # Returns (entry, updated) where updated is True if the metadata had to be read again
+        st = st or os.stat(os.path.join(self.__root, name))
+        cached = self.__meta.get(name)
+        updated = not cached or cached["mtime"] != st.st_mtime or cached["size"] != st.st_size
+        if updated:
+            try:
+                meta = self.__extractor(os.path.join(self.__root, name))
+            except Exception as e:
+                meta = {"type": "file", "error": str(e)}
+            cached = self.__meta[name] = {"mtime": st.st_mtime, "size": st.st_size, "meta": meta}
+        return {"name": os.path.basename(name), "size": cached["size"], "mtime": cached["mtime"],
+                **cached["meta"]}, updated
+
+    def __load(self):
+        if not self.__cache_path or not os.path.exists(self.__cache_path):
+            return
+        try:
+            with open(self.__cache_path, "r") as json_file:
+                self.__meta = json.load(json_file)
+        except (OSError, ValueError) as e:
+            print('Error loading file index,', e)
+
+    def __save(self):
+        if not self.__cache_path:
+            return
+        existing = {name: m for name, m in self.__meta.items() if os.path.exists(os.path.join(self.__root, name))}
+        self.__meta = existing  # forget deleted files
+        tmp_path = f"{self.__cache_path}.tmp"
+        with open(tmp_path, "w") as json_file:
+            json.dump(existing, json_file)
+        os.replace(tmp_path, self.__cache_path)
+
+
+def directory_entry(name, files):
+    return {
+        "name": name,
+        "type": "directory",
+        "files": len(files),
+        "size": sum(f["size"] for f in files),
+        "mtime": max((f["mtime"] for f in files), default=0),
+        "frames": sum(f.get("frames", 0) for f in files),
+        "duration": round(sum(f.get("duration") or 0 for f in files), 2)
+    }
@@ -0,0 +1,68 @@
+from collections import deque
+
+import cv2
+import numpy as np
+import torch
+
+from utils.metrics import box_iou
+
+
+def dhash(im, hash_size=8):
+    # Difference hash of a BGR image: sign of horizontal gradients on a (hash_size, hash_size + 1) grey thumbnail
+    grey = cv2.cvtColor(im, cv2.COLOR_BGR2GRAY) if im.ndim == 3 else im
+    small = cv2.resize(grey, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class FrameDeduplicator:
+    """
+    Drops near-duplicate frames before they are written and uploaded, i.e. consecutive frames of a stopped bus.
+    A frame is a duplicate of a recently kept frame when their dHashes differ by at most `max_distance` bits
+    and they have the same detections (same classes, each box overlapping its counterpart by `min_iou` or more).
+    Only the last `window` kept frames are compared against.
+    """
+
+    def __init__(self, max_distance=6, min_iou=0.7, window=32, hash_size=8):
+        self.__max_distance = max_distance
+        self.__min_iou = min_iou
+        self.__hash_size = hash_size
+        self.__index = deque(maxlen=window)  # (hash, classes, normalised xyxy boxes) of kept frames
+        self.__kept = 0
+        self.__dropped = 0
+
+    def keep(self, im, det):
+        # det is an (n, 6) xyxy, conf, cls tensor in im pixels, returns True (and indexes the frame) if it is new
+        h, w = im.shape[:2]
+        frame_hash = dhash(im, self.__hash_size)
+        det = det.detach().cpu()
+        classes = det[:, 5].int()
+        boxes = det[:, :4] / torch.tensor([w, h, w, h], dtype=det.dtype)
+        for other_hash, other_classes, other_boxes in reversed(self.__index):  # most recent first
+            if hamming(frame_hash, other_hash) <= self.__max_distance and \
+                    self.__same_detections(classes, boxes, other_classes, other_boxes):
+                self.__dropped += 1
+                return False
+        self.__index.append((frame_hash, classes, boxes))
+        self.__kept += 1
+        return True
+
+    def __same_detections(self, classes, boxes, other_classes, other_boxes):
+        if len(classes) != len(other_classes) or not torch.equal(classes.sort()[0], other_classes.sort()[0]):
+            return False
+        if not len(classes):
+            return True
+        iou = box_iou(boxes, other_boxes) * (classes[:, None] == other_classes[None])
+        return bool((iou.max(1)[0] >= self.__min_iou).all())
+
+    def get_stats(self):
+        total = self.__kept + self.__dropped
+        return {
+            "kept": self.__kept,
+            "dropped": self.__dropped,
+            "drop_ratio": round(self.__dropped / total, 3) if total else 0.0
+        }
@@ -0,0 +1,132 @@
+import functools
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from classes.file_index import sha256_file
+
+
+@functools.lru_cache(maxsize=256)
+def _hash(path, mtime, size):
+    return sha256_file(path)
+
+
+def content_hash(path):
+    # sha256 of a file, computed once per (path, mtime, size) in this process
+    st = os.stat(path)
+    return _hash(os.path.abspath(path), st.st_mtime, st.st_size)
+
+
+class InferenceCache:
+    """
+    On-disk cache of NMS outputs per frame, one compressed npz per (source file content, model settings) holding
+    the frame indices, per-frame offsets and the concatenated (n, 6) xyxy, conf, cls rows in letterboxed pixels.
+    The model settings key covers the weights hash, imgsz, IoU threshold, classes, agnostic NMS, max_det and the
+    letterbox stride and auto flag (boxes are in letterboxed pixels) but not conf_thres: results cached at a lower threshold are filtered to answer a higher one, since NMS never lets
+    a lower-confidence box suppress a higher one, so a confidence sweep runs the model once.
+    Least recently used files are deleted once the cache exceeds max_mb.
+    """
+
+    def __init__(self, cache_dir, weights, conf_thres, max_mb=512, **settings):
+        self.__cache_dir = cache_dir
+        self.__conf_thres = conf_thres
+        self.__max_bytes = max_mb * 1024 ** 2
+        settings["weights"] = content_hash(weights) if os.path.isfile(weights) else str(weights)
+        self.__key = hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        self.__lock = threading.Lock()
+        self.__entries = {}  # source path -> {"file", "conf", "frames": {frame: det}, "dirty"}
+        self.__hits = 0
+        self.__misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, path, frame):
+        # Cached detections of a frame as a float32 (n, 6) array, None on a miss
+        with self.__lock:
+            det = self.__entry(path)["frames"].get(frame)
+            if det is None:
+                self.__misses += 1
+                return None
+            self.__hits += 1
+        return det[det[:, 4] > self.__conf_thres]
+
+    def put(self, path, frame, det):
+        with self.__lock:
+            entry = self.__entry(path)
+            entry["conf"] = max(entry["conf"], self.__conf_thres)  # the file can only answer this threshold or above
+            # Copied, det is often a view of a tensor whose boxes are scaled in place after NMS
+            entry["frames"][frame] = np.array(det, dtype=np.float32, copy=True).reshape(-1, 6)
+            entry["dirty"] = True
+
+    def flush(self):
+        # Write changed entries, then evict least recently used files down to max_mb
+        with self.__lock:
+            for entry in self.__entries.values():
+                if entry["dirty"]:
+                    write_entry(entry)
+                    entry["dirty"] = False
+            self.__evict()
+
+    def get_stats(self):
+        total = self.__hits + self.__misses
+        return {
+            "cache_hits": self.__hits,
+            "cache_misses": self.__misses,
+            "cache_hit_ratio": round(self.__hits / total, 3) if total else 0.0
+        }
+
+    def __entry(self, path):
+        entry = self.__entries.get(path)
+        if entry is None:
+            file = os.path.join(self.__cache_dir, f"{content_hash(path)[:16]}_{self.__key}.npz")
+            entry = {"file": file, "conf": self.__conf_thres, "frames": {}, "dirty": False}
+            if os.path.exists(file):
+                try:
+                    entry = read_entry(file, self.__conf_thres) or entry
+                    os.utime(file)  # recently used
+                except (OSError, ValueError, KeyError) as e:
+                    print('Error loading inference cache,', e)
+            self.__entries[path] = entry
+        return entry
+
+    def __evict(self):
+        files = [os.path.join(self.__cache_dir, f) for f in os.listdir(self.__cache_dir) if f.endswith(".npz")]
+        files.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(f) for f in files)
+        in_use = {entry["file"] for entry in self.__entries.values()}
+        for f in files:
+            if total <= self.__max_bytes:
+                break
+            if f not in in_use:
+                total -= os.path.getsize(f)
+                os.remove(f)
+
+
+def read_entry(file, conf_thres):
+    # None if the file was cached at a higher conf_thres, its results cannot answer a lower one
+    with np.load(file) as data:
+        conf = float(data["conf"])
+        if conf > conf_thres:
+            return None
+        frames, offsets, dets = data["frames"], data["offsets"], data["dets"]
+        return {
+            "file": file,
+            "conf": conf,
+            "frames": {int(f): dets[offsets[i]:offsets[i + 1]] for i, f in enumerate(frames)},
+            "dirty": False
+        }
+
+
+def write_entry(entry):
+    frames = sorted(entry["frames"])
+    dets = [entry["frames"][f] for f in frames]
+    offsets = np.cumsum([0] + [len(d) for d in dets])
+    tmp_path = f"{entry['file']}.tmp.npz"
+    np.savez_compressed(tmp_path,
+                        conf=np.float32(entry["conf"]),
+                        frames=np.array(frames, dtype=np.int64),
+                        offsets=offsets.astype(np.int64),
+                        dets=np.concatenate(dets) if dets else np.zeros((0, 6), dtype=np.float32))
+    os.replace(tmp_path, entry["file"])
@@ -0,0 +1,186 @@
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+from uuid import uuid4
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class Job:
+    def __init__(self, kind, params, id=None, status=QUEUED, created_at=None, secrets=None, on_checkpoint=None):
+        self.__id = id or uuid4().hex
+        self.__kind = kind
+        self.__params = params
+        self.__secrets = secrets or {}  # i.e. API keys, kept in memory only and never written to the job store
+        self.status = status
+        self.created_at = created_at or time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = {}
+        self.checkpoint = {}  # handler state saved with the job, i.e. files already finished, to resume after a restart
+        self.__on_checkpoint = on_checkpoint
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+
+    def get_id(self):
+        return self.__id
+
+    def get_kind(self):
+        return self.__kind
+
+    def get_params(self):
+        return self.__params
+
+    def get_secrets(self):
+        return self.__secrets
+
+    def update_progress(self, done, total, **extra):
+        # done/total are in the job's own units (frames, files), rate and ETA are derived from them
+        elapsed = time.time() - self.started_at if self.started_at else 0
+        rate = done / elapsed if elapsed > 0 else 0.0
+        self.progress = {
+            "done": done,
+            "total": total,
+            "percent": round(100 * done / total, 1) if total else 0.0,
+            "rate": round(rate, 2),
+            "eta": round((total - done) / rate, 1) if rate and total else None,
+            **extra
+        }
+
+    def save_checkpoint(self, **state):
+        # Unlike progress, a checkpoint is written to the job store straight away
+        self.checkpoint.update(state)
+        if self.__on_checkpoint:
+            self.__on_checkpoint()
+
+    def return_json(self):
+        output = {
+            "id": self.__id,
+            "kind": self.__kind,
+            "params": self.__params,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress,
+            "checkpoint": self.checkpoint,
+            "result": self.result,
+            "error": self.error
+        }
+        return output
+
+
+class JobQueue:
+    """
+    Background job runner with a small JSON job store.
+    handlers maps a job kind to fn(params, job) which runs on a worker thread, reports through
+    job.update_progress() and should return early once job.cancel_event is set.
+    Jobs that were queued or running when the app stopped are queued again on start(), without their secrets,
+    and handlers can skip work recorded with job.save_checkpoint() before the restart.
+    """
+
+    def __init__(self, store_path, handlers, workers=1):
+        self.__store_path = store_path
+        self.__handlers = handlers
+        self.__workers = workers
+        self.__jobs = {}
+        self.__queue = queue.Queue()
+        self.__lock = threading.RLock()
+        self.__threads = []
+        self.__load()
+
+    def start(self):
+        with self.__lock:
+            if self.__threads:
+                return
+            for job in sorted(self.__jobs.values(), key=lambda j: j.created_at):
+                if job.status in (QUEUED, RUNNING):  # interrupted by a restart
+                    job.status = QUEUED
+                    self.__queue.put(job.get_id())
+            for _ in range(self.__workers):
+                thread = threading.Thread(target=self.__run, daemon=True)
+                thread.start()
+                self.__threads.append(thread)
+
+    def submit(self, kind, params, secrets=None):
+        assert kind in self.__handlers, f'unknown job kind {kind}'
+        job = Job(kind, params, secrets=secrets, on_checkpoint=self.__checkpoint)
+        with self.__lock:
+            self.__jobs[job.get_id()] = job
+            self.__save()
+            started = bool(self.__threads)
+        if started:
+            self.__queue.put(job.get_id())
+        else:
+            self.start()  # queues every pending job, including this one
+        return job.get_id()
+
+    def get(self, job_id):
+        job = self.__jobs.get(job_id)
+        return job.return_json() if job else None
+
+    def list(self):
+        with self.__lock:
+            return [job.return_json() for job in sorted(self.__jobs.values(), key=lambda j: j.created_at)]
+
+    def cancel(self, job_id):
+        # Returns False if the job does not exist or has already finished
+        with self.__lock:
+            job = self.__jobs.get(job_id)
+            if job is None or job.status not in (QUEUED, RUNNING):
+                return False
+            job.cancel_event.set()
+            if job.status == QUEUED:
+                self.__finish(job, CANCELLED)
+            return True
+
+    def __run(self):
+        while True:
+            job = self.__jobs.get(self.__queue.get())
+            with self.__lock:
+                if job is None or job.status != QUEUED:  # cancelled while queued
+                    continue
+                job.status, job.started_at = RUNNING, time.time()
+                self.__save()
+            try:
+                job.result = self.__handlers[job.get_kind()](job.get_params(), job)
+                self.__finish(job, CANCELLED if job.cancel_event.is_set() else DONE)
+            except Exception as e:
+                traceback.print_exc()
+                job.error = str(e)
+                self.__finish(job, FAILED)
+
+    def __checkpoint(self):
+        with self.__lock:
+            self.__save()
+
+    def __finish(self, job, status):
+        job.status, job.finished_at = status, time.time()
+        with self.__lock:
+            self.__save()
+
+    def __load(self):
+        if not os.path.exists(self.__store_path):
+            return
+        try:
+            with open(self.__store_path, "r") as json_file:
+                for data in json.load(json_file):
+                    job = Job(data["kind"], data["params"], id=data["id"], status=data["status"],
+                              created_at=data["created_at"], on_checkpoint=self.__checkpoint)
+                    job.started_at, job.finished_at = data["started_at"], data["finished_at"]
+                    job.progress, job.result, job.error = data["progress"], data["result"], data["error"]
+                    job.checkpoint = data.get("checkpoint", {})
+                    self.__jobs[job.get_id()] = job
+        except (OSError, ValueError, KeyError) as e:
+            print('Error loading job store,', e)
+
+    def __save(self):
+        # Written on status changes only, progress updates stay in memory
+        tmp_path = f"{self.__store_path}.tmp"
+        with open(tmp_path, "w") as json_file:
+            json.dump([job.return_json() for job in self.__jobs.values()], json_file)
+        os.replace(tmp_path, self.__store_path)
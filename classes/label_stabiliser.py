@@ -0,0 +1,101 @@
+class VoteWindow:
+    """
+    Majority vote over the last `size` frames, kept in a fixed-size ring buffer with running
+    per-class counts so each frame costs O(labels in that frame).
+    A class becomes active once it has `on_votes` votes in the window and only drops out
+    when it falls below `off_votes` (hysteresis), so single-frame blips neither add nor remove it.
+    Classes passed as `fast` to push() become active with `fast_on_votes` instead, i.e. expected ones.
+    """
+
+    def __init__(self, size, on_votes, off_votes, fast_on_votes=None):
+        fast_on_votes = on_votes if fast_on_votes is None else fast_on_votes
+        assert 0 < off_votes <= fast_on_votes <= on_votes <= size, \
+            'expected 0 < off_votes <= fast_on_votes <= on_votes <= size'
+        self.__size = size
+        self.__on_votes = on_votes
+        self.__fast_on_votes = fast_on_votes
+        self.__off_votes = off_votes
+        self.__frames = [()] * size  # ring buffer of per-frame labels
+        self.__index = 0
+        self.__counts = {}
+        self.__active = set()
+
+    def push(self, labels, fast=()):
+        # Returns True if the active set changed
+        evicted = self.__frames[self.__index]
+        for label in evicted:
+            self.__counts[label] -= 1
+            if self.__counts[label] == 0:
+                del self.__counts[label]
+        labels = tuple(dict.fromkeys(labels))  # unique, order kept
+        for label in labels:
+            self.__counts[label] = self.__counts.get(label, 0) + 1
+        self.__frames[self.__index] = labels
+        self.__index = (self.__index + 1) % self.__size
+
+        before = set(self.__active)
+        for label in before:
+            if self.__counts.get(label, 0) < self.__off_votes:
+                self.__active.discard(label)
+        for label in labels:
+            if self.__counts[label] >= (self.__fast_on_votes if label in fast else self.__on_votes):
+                self.__active.add(label)
+        return self.__active != before
+
+    def get_active(self):
+        return set(self.__active)
+
+    def get_votes(self, label):
+        return self.__counts.get(label, 0)
+
+    def reset(self):
+        self.__frames = [()] * self.__size
+        self.__index = 0
+        self.__counts = {}
+        self.__active = set()
+
+
+class LabelStabiliser:
+    """
+    Temporal smoothing of per-frame labels ({'light': str, 'number': [str]}) before they are announced.
+    Traffic lights use a short window (fast path) since they need near real-time announcing,
+    bus numbers use a long window (slow path) so a flickering route number is not read out.
+    Route numbers that are expected at the bus stop only need number_expected_on votes.
+    """
+
+    def __init__(self, light_window=3, light_on=2, light_off=1, number_window=15, number_on=10, number_off=5,
+                 number_expected_on=6):
+        self.__lights = VoteWindow(light_window, light_on, light_off)
+        self.__numbers = VoteWindow(number_window, number_on, number_off, fast_on_votes=number_expected_on)
+        self.__order = []  # left-to-right order of numbers in the most recent frame they were seen
+        self.__label = {'light': '', 'number': []}
+
+    def update(self, lbl_raw, expected=None):
+        # Returns (stable label, update) where update is True when the stable label changed,
+        # expected is the route numbers arriving at the stop, if known
+        light = lbl_raw['light']
+        light_changed = self.__lights.push([light] if light else [])
+        number_changed = self.__numbers.push(lbl_raw['number'], fast=set(expected or ()))
+
+        if lbl_raw['number']:
+            self.__order = list(lbl_raw['number']) + [n for n in self.__order if n not in lbl_raw['number']]
+        if not (light_changed or number_changed):
+            return self.__label, False
+
+        active_lights = self.__lights.get_active()
+        active_numbers = self.__numbers.get_active()
+        self.__label = {
+            # Lights are mutually exclusive, keep the one with the most votes
+            'light': max(active_lights, key=self.__lights.get_votes) if active_lights else '',
+            'number': [n for n in self.__order if n in active_numbers]
+        }
+        return self.__label, True
+
+    def get_label(self):
+        return self.__label
+
+    def reset(self):
+        self.__lights.reset()
+        self.__numbers.reset()
+        self.__order = []
+        self.__label = {'light': '', 'number': []}
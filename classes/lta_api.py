@@ -1,13 +1,18 @@
-import json
-from urllib.parse import urlparse
-from datetime import datetime, timedelta
-import httplib2 as http
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+LTA_BASE_URL = os.getenv("LTA_BASE_URL", "http://datamall2.mytransport.sg/ltaodataservice/")
 
 
 class BusArrival:
     def __init__(self, num, est):
         self.__num = num
-        self.__est = est
+        self.__est = est  # timezone-aware datetime, parsed once when fetched
 
     def get_num(self):
         return self.__num
@@ -15,51 +20,150 @@ class BusArrival:
     def get_est(self):
         return self.__est
 
+    def return_json(self):
+        output = {
+            "service": self.__num,
+            "estimated_arrival": self.__est.isoformat(),
+            "eta": round((self.__est - datetime.now(timezone.utc)).total_seconds())
+        }
+        return output
 
-# Writes arriving busses for specified bus stop to bus_arr.txt file every minute
-def bus_order(bus_code, api_key):
-    # API Key and format
-    headers = {
-        'AccountKey': api_key,
-        'accept': 'application/json'
-    }
 
-    uri = "http://datamall2.mytransport.sg/"
-    path = "ltaodataservice/BusArrivalv2"
-    query = "?BusStopCode="
-    h = http.Http()
-    while True:
-        target = urlparse(uri + path + query + bus_code)  # Parse API URI
-        method = "GET"
-        body = ""
-        response, content = h.request(
-            target.geturl(),
-            method,
-            body,
-            headers
-        )
-        json_obj = json.loads(content)
-        bus_list = []
-        datetime_format = "%Y-%m-%dT%H:%M:%S+08:00"
-        for service in json_obj.get("Services"):
-            for i in range(1, 4):
-                count = ""
-                if i > 1:
-                    count = str(i)
-                if try_parse(service.get(f"NextBus{count}").get("EstimatedArrival")):
-                    bus_list.append(BusArrival(service.get("ServiceNo"),
-                                               datetime.strptime(service.get(f"NextBus{count}").get("EstimatedArrival"),
-                                                                 datetime_format)))
-        sorted_bus_list = list(map(lambda x: x.get_num(),
-                                   filter(lambda y: y.get_est() < datetime.now() + timedelta(minutes=3),
-                                          sorted(bus_list, key=lambda x: x.get_est()))))
-        print(sorted_bus_list)
-
-
-# Check if you can parse as datetime object
-def try_parse(dt):
+class ArrivalService:
+    """
+    DataMall bus arrival client with a pooled HTTP session and a per-bus-stop TTL cache.
+    Concurrent callers for the same stop share one in-flight request, and watched stops are refreshed by
+    one poller thread that backs off exponentially while DataMall is failing.
+    """
+
+    def __init__(self, api_key, base_url=LTA_BASE_URL, ttl=20.0, timeout=5.0, session=None):
+        self.__base_url = base_url.rstrip("/") + "/"
+        self.__ttl = ttl
+        self.__timeout = timeout
+        self.__session = session or requests.Session()
+        self.__session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+        self.__session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+        self.__session.headers.update({"AccountKey": api_key, "accept": "application/json"})
+        self.__lock = threading.Lock()
+        self.__cache = {}  # bus stop code -> (fetched_at, [BusArrival] sorted by arrival)
+        self.__fetching = {}  # bus stop code -> Lock, so concurrent callers fetch a stop only once
+        self.__watched = {}  # bus stop code -> poll interval
+        self.__poller = None  # (thread, stop event)
+
+    def get_arrivals(self, bus_code, max_age=None):
+        # Returns [BusArrival] for the stop, sorted by estimated arrival, from cache if younger than max_age
+        bus_code = str(bus_code)
+        max_age = self.__ttl if max_age is None else max_age
+        with self.__lock:
+            cached = self.__fresh(bus_code, max_age)
+            if cached is not None:
+                return cached
+            fetching = self.__fetching.setdefault(bus_code, threading.Lock())
+        with fetching:
+            with self.__lock:
+                cached = self.__fresh(bus_code, max_age)  # fetched by another caller while waiting
+                if cached is not None:
+                    return cached
+            arrivals = self.__fetch(bus_code)
+            with self.__lock:
+                self.__cache[bus_code] = (time.monotonic(), arrivals)
+                self.__fetching.pop(bus_code, None)
+        return arrivals
+
+    def expected_services(self, bus_code, within=180, max_age=None, cached=False):
+        # Service numbers arriving within `within` seconds, soonest first. cached=True never blocks on a request,
+        # i.e. from the detection loop of a watched stop, and returns None until the stop was first fetched
+        arrivals = self.get_cached(bus_code) if cached else self.get_arrivals(bus_code, max_age)
+        if arrivals is None:
+            return None
+        deadline = datetime.now(timezone.utc) + timedelta(seconds=within)
+        return list(dict.fromkeys(a.get_num() for a in arrivals if a.get_est() < deadline))
+
+    def get_cached(self, bus_code):
+        # Last fetched arrivals without a request, None if the stop was never fetched
+        with self.__lock:
+            cached = self.__cache.get(str(bus_code))
+        return cached[1] if cached else None
+
+    def watch(self, bus_code, interval=30.0):
+        # Keep a stop refreshed in the background, starting the poller on first use
+        with self.__lock:
+            self.__watched[str(bus_code)] = interval
+            if self.__poller is None or not self.__poller[0].is_alive():
+                stop_event = threading.Event()
+                self.__poller = (threading.Thread(target=self.__poll, args=(stop_event,), daemon=True), stop_event)
+                self.__poller[0].start()
+
+    def unwatch(self, bus_code=None):
+        # Stop refreshing one stop, or every stop and the poller when bus_code is None
+        with self.__lock:
+            if bus_code is None:
+                self.__watched.clear()
+                if self.__poller is not None:
+                    self.__poller[1].set()
+                    self.__poller = None
+            else:
+                self.__watched.pop(str(bus_code), None)
+
+    def __fresh(self, bus_code, max_age):
+        cached = self.__cache.get(bus_code)
+        if cached and time.monotonic() - cached[0] < max_age:
+            return cached[1]
+        return None
+
+    def __fetch(self, bus_code):
+        response = self.__session.get(self.__base_url + "BusArrivalv2", params={"BusStopCode": bus_code},
+                                      timeout=self.__timeout)
+        response.raise_for_status()
+        return parse_arrivals(response.json())
+
+    def __poll(self, stop_event):
+        next_due, failures = {}, 0
+        while not stop_event.is_set():
+            with self.__lock:
+                watched = dict(self.__watched)
+            now = time.monotonic()
+            for bus_code, interval in watched.items():
+                if next_due.get(bus_code, 0) > now:
+                    continue
+                try:
+                    self.get_arrivals(bus_code, max_age=interval / 2)
+                    failures = 0
+                    next_due[bus_code] = now + interval
+                except (requests.RequestException, ValueError) as e:
+                    failures += 1
+                    next_due[bus_code] = now + min(interval * 2 ** failures, 300)
+                    print("Bus arrivals for {} failed, retrying in {:.0f}s, {}".format(
+                        bus_code, next_due[bus_code] - now, e))
+            wait = min(next_due.values(), default=now + 1) - time.monotonic()
+            stop_event.wait(min(max(wait, 0.1), 1.0))  # wakes at least every second for new stops
+
+
+def parse_arrivals(json_obj):
+    # [BusArrival] for NextBus, NextBus2 and NextBus3 of every service, sorted by estimated arrival
+    bus_list = []
+    for service in json_obj.get("Services", []):
+        for key in ("NextBus", "NextBus2", "NextBus3"):
+            est = parse_time((service.get(key) or {}).get("EstimatedArrival"))
+            if est is not None:
+                bus_list.append(BusArrival(service.get("ServiceNo"), est))
+    return sorted(bus_list, key=lambda x: x.get_est())
+
+
+def parse_time(value):
+    # DataMall timestamps look like 2023-07-21T14:02:38+08:00, empty when there is no next bus
     try:
-        datetime.strptime(dt, "%Y-%m-%dT%H:%M:%S+08:00")
-        return True
-    except ValueError:
-        return False
\ No newline at end of file
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Prints the services arriving at a bus stop within 3 minutes every 30 seconds
+def bus_order(bus_code, api_key, interval=30.0):
+    service = ArrivalService(api_key)
+    while True:
+        try:
+            print(service.expected_services(bus_code))
+        except (requests.RequestException, ValueError) as e:
+            print('Error fetching bus arrivals,', e)
+        time.sleep(interval)
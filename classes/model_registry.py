@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from models.common import DetectMultiBackend
+from utils.torch_utils import select_device
+
+
+class ModelRegistry:
+    """
+    Process-wide LRU cache of loaded DetectMultiBackend models, keyed by weights path, file mtime,
+    device, precision and backend selection. Least recently used models are evicted once the resident models exceed
+    max_mb, and a changed weights file (new mtime) is loaded again rather than served stale.
+    """
+
+    def __init__(self, max_mb=1024):
+        self.__max_bytes = max_mb * 1024 ** 2
+        self.__models = OrderedDict()  # key -> {"model", "bytes", "loaded_at", "last_used", "hits"}
+        self.__lock = threading.Lock()
+        self.__loading = {}  # key -> Lock, so concurrent callers load a model only once
+
+    def get(self, weights, device='', dnn=False, data=None, half=False, autobackend=False, imgsz=(640, 640),
+            fastload=False):
+        # autobackend=True loads the fastest CPU backend for .pt weights, benchmarked at imgsz
+        # fastload='fused' or 'torchscript' loads a pre-built artifact of .pt weights, traced at imgsz
+        device = select_device(device)
+        key = self.__key(weights, device, dnn, data, half) + ((tuple(imgsz) if autobackend else False), fastload)
+        with self.__lock:
+            entry = self.__hit(key)
+            if entry:
+                return entry["model"]
+            loading = self.__loading.setdefault(key, threading.Lock())
+        with loading:
+            with self.__lock:
+                entry = self.__hit(key)  # loaded by another caller while waiting
+                if entry:
+                    return entry["model"]
+            model = DetectMultiBackend(weights, device=device, dnn=dnn, data=data, fp16=half,
+                                       autobackend=autobackend, imgsz=imgsz, fastload=fastload)
+            with self.__lock:
+                self.__models[key] = {
+                    "model": model,
+                    "bytes": model_bytes(model, key[0]),
+                    "loaded_at": time.time(),
+                    "last_used": time.time(),
+                    "hits": 0
+                }
+                self.__evict(keep=key)
+                self.__loading.pop(key, None)
+        return model
+
+    def resident(self):
+        # Resident models, most recently used last
+        with self.__lock:
+            return [{
+                "weights": os.path.basename(key[0]),
+                "path": key[0],
+                "device": key[2],
+                "half": key[4],
+                "size_mb": round(entry["bytes"] / 1024 ** 2, 1),
+                "loaded_at": entry["loaded_at"],
+                "last_used": entry["last_used"],
+                "hits": entry["hits"]
+            } for key, entry in self.__models.items()]
+
+    def clear(self):
+        with self.__lock:
+            self.__models.clear()
+
+    def __hit(self, key):
+        entry = self.__models.get(key)
+        if entry:
+            self.__models.move_to_end(key)
+            entry["last_used"] = time.time()
+            entry["hits"] += 1
+        return entry
+
+    def __evict(self, keep):
+        # Drop least recently used models until within budget, never the one just loaded
+        while sum(e["bytes"] for e in self.__models.values()) > self.__max_bytes and len(self.__models) > 1:
+            key = next(iter(self.__models))
+            if key == keep:
+                break
+            del self.__models[key]
+
+    @staticmethod
+    def __key(weights, device, dnn, data, half):
+        w = str(weights[0] if isinstance(weights, (list, tuple)) else weights)
+        path = os.path.abspath(w)
+        mtime = os.path.getmtime(path) if os.path.exists(path) else 0
+        return path, mtime, str(device), bool(dnn), bool(half), str(data)
+
+
+def model_bytes(model, path):
+    # Parameter memory of a PyTorch model, file size for exported backends without torch parameters
+    size = sum(p.numel() * p.element_size() for p in model.parameters())
+    if not size and os.path.isfile(path):
+        size = os.path.getsize(path)
+    return size
+
+
+model_registry = ModelRegistry(max_mb=int(os.getenv('MODEL_CACHE_MB', 1024)))
@@ -0,0 +1,69 @@
+import copy
+import json
+import os
+import threading
+import time
+
+
+class ResultStore:
+    """
+    Lock-protected, versioned hand-off of the latest detection result between the detector
+    and the Flask routes. Readers always get a complete copy of one published result, and
+    the result is optionally snapshotted to disk at most once every snapshot_interval seconds.
+    The version only moves when the label set or the update flag changes, so subscribers
+    blocked in wait() are woken for meaningful changes only.
+    """
+
+    def __init__(self, snapshot_path=None, snapshot_interval=1.0):
+        self.__lock = threading.Condition()
+        self.__version = 0
+        self.__data = {
+            "label": {"light": "", "number": []},
+            "update": False,
+            "last_updated": ""
+        }
+        self.__snapshot_path = snapshot_path
+        self.__snapshot_interval = snapshot_interval
+        self.__last_snapshot = 0.0
+
+    def publish(self, data):
+        with self.__lock:
+            changed = (data.get("label") != self.__data.get("label") or
+                       data.get("update") != self.__data.get("update"))
+            self.__data = copy.deepcopy(data)
+            if changed:
+                self.__version += 1
+                self.__lock.notify_all()
+            version = self.__version
+        self.__maybe_snapshot()
+        return version
+
+    def get(self):
+        # Returns (version, data)
+        with self.__lock:
+            return self.__version, copy.deepcopy(self.__data)
+
+    def wait(self, version, timeout=None):
+        # Block until the version differs from the given one or timeout, returns (version, data)
+        with self.__lock:
+            self.__lock.wait_for(lambda: self.__version != version, timeout=timeout)
+            return self.__version, copy.deepcopy(self.__data)
+
+    def get_version(self):
+        return self.__version
+
+    def __maybe_snapshot(self):
+        if self.__snapshot_path is None:
+            return
+        now = time.monotonic()
+        if now - self.__last_snapshot < self.__snapshot_interval:
+            return
+        self.__last_snapshot = now
+        _, data = self.get()
+        tmp_path = f"{self.__snapshot_path}.tmp"
+        try:
+            with open(tmp_path, "w") as json_file:
+                json.dump(data, json_file)
+            os.replace(tmp_path, self.__snapshot_path)  # atomic, readers never see a partial file
+        except OSError as e:
+            print('Error writing label snapshot,', e)
@@ -1,11 +1,19 @@
-import roboflow
+import hashlib
+import json
 import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 class RoboflowAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, rf=None):
         self.__project = None
-        self.__rf = roboflow.Roboflow(api_key=api_key)
+        if rf is None:
+            import roboflow
+            rf = roboflow.Roboflow(api_key=api_key)
+        self.__rf = rf  # any client with workspace().projects() and workspace().project(id), i.e. a local fake
 
     def get_projects(self):
         return self.__rf.workspace().projects()
@@ -14,9 +22,121 @@ class RoboflowAPI:
         self.__project = self.__rf.workspace().project(project_id)
         return
 
-    def upload_image(self, folder_dir):
-        if self.__project:
-            for images in os.listdir(folder_dir):
-                if images.endswith(".jpg"):
-                    self.__project.upload(f"{folder_dir}\\{images}", f"{folder_dir}\\{images.removesuffix('.jpg') + '.json'}")
-        return True
\ No newline at end of file
+    def get_project(self):
+        return self.__project
+
+    def upload_image(self, folder_dir, manifest_path=None, **kwargs):
+        # Returns the RoboflowUploader summary, kwargs are passed to RoboflowUploader.upload()
+        if not self.__project:
+            return None
+        manifest = UploadManifest(manifest_path or os.path.join(folder_dir, ".upload_manifest.jsonl"))
+        return RoboflowUploader(self.__project, manifest).upload(folder_dir, **kwargs)
+
+
+def file_hash(path, chunk_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class UploadManifest:
+    """
+    Append-only JSON lines record of uploaded image hashes per project.
+    Each upload is one line appended as soon as it succeeds, so an interrupted upload loses at most
+    the images in flight and a re-run sends only what is missing.
+    """
+
+    def __init__(self, path):
+        self.__path = path
+        self.__lock = threading.Lock()
+        self.__uploaded = set()  # (project, sha1)
+        if os.path.exists(path):
+            with open(path, "r") as manifest_file:
+                for line in manifest_file:
+                    try:
+                        entry = json.loads(line)
+                        self.__uploaded.add((entry["project"], entry["sha1"]))
+                    except (ValueError, KeyError):
+                        continue  # partly written last line
+
+    def contains(self, project, sha1):
+        with self.__lock:
+            return (project, sha1) in self.__uploaded
+
+    def add(self, project, sha1, file_name):
+        with self.__lock:
+            self.__uploaded.add((project, sha1))
+            with open(self.__path, "a") as manifest_file:
+                manifest_file.write(json.dumps({"project": project, "sha1": sha1, "file": file_name,
+                                                "uploaded_at": time.time()}) + "\n")
+
+    def __len__(self):
+        return len(self.__uploaded)
+
+
+class RoboflowUploader:
+    """
+    Uploads the labelled images of a folder on a bounded thread pool.
+    Failed uploads are retried with exponential backoff and jitter, and images whose hash is already in the
+    manifest for this project are skipped, so a folder can be uploaded again to resume without duplicates.
+    project only needs an upload(image_path, annotation_path) method raising on failure, i.e. a roboflow Project.
+    """
+
+    def __init__(self, project, manifest, workers=4, retries=4, backoff=1.0):
+        self.__project = project
+        self.__project_id = str(getattr(project, "id", project.__class__.__name__))
+        self.__manifest = manifest
+        self.__workers = workers
+        self.__retries = retries
+        self.__backoff = backoff
+
+    def upload(self, folder_dir, progress=None, stop_event=None):
+        # progress(done, total, **counts) is called after every image, returns the final counts
+        stop_event = stop_event or threading.Event()
+        pending, counts, seen = [], {"uploaded": 0, "skipped": 0, "failed": 0}, set()
+        for image in sorted(os.listdir(folder_dir)):
+            if not image.endswith(".jpg"):
+                continue
+            image_path = os.path.join(folder_dir, image)
+            sha1 = file_hash(image_path)
+            if sha1 in seen or self.__manifest.contains(self.__project_id, sha1):
+                counts["skipped"] += 1
+            else:
+                seen.add(sha1)
+                pending.append((image_path, annotation_path(folder_dir, image), sha1))
+        total = len(pending) + counts["skipped"]
+        if progress:
+            progress(counts["skipped"], total, **counts)
+
+        with ThreadPoolExecutor(max_workers=self.__workers) as executor:
+            futures = [executor.submit(self.__upload_one, *item, stop_event) for item in pending]
+            for future in as_completed(futures):
+                counts["uploaded" if future.result() else "failed"] += 1
+                if progress:
+                    progress(sum(counts.values()), total, **counts)
+        return counts
+
+    def __upload_one(self, image_path, annotation, sha1, stop_event):
+        for attempt in range(self.__retries + 1):
+            if stop_event.is_set():
+                return False
+            try:
+                self.__project.upload(image_path, annotation)
+                self.__manifest.add(self.__project_id, sha1, os.path.basename(image_path))
+                return True
+            except Exception as e:
+                print("Upload of {} failed ({}/{}), {}".format(image_path, attempt + 1, self.__retries + 1, e))
+                if attempt < self.__retries:
+                    stop_event.wait(self.__backoff * 2 ** attempt + random.uniform(0, self.__backoff))
+        return False
+
+
+def annotation_path(folder_dir, image):
+    # <image>.json written next to each image, or the folder's single COCO file
+    for name in (image[:-len(".jpg")] + ".json", "_annotations.coco.json"):
+        path = os.path.join(folder_dir, name)
+        if os.path.exists(path):
+            return path
+    return None
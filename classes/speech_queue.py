@@ -0,0 +1,66 @@
+import itertools
+import queue
+import threading
+import time
+
+
+class SpeechQueue:
+    """
+    Single text-to-speech worker thread that owns one pyttsx3 engine.
+    Announcements go through a bounded priority queue, so traffic lights are spoken before bus numbers,
+    identical phrases within `cooldown` seconds are coalesced, and announcements that waited longer than
+    `max_age` seconds or were superseded by a newer one of the same priority are dropped.
+    """
+    LIGHT = 0  # highest priority
+    BUS = 1
+
+    def __init__(self, rate=150, maxsize=8, cooldown=5.0, max_age=3.0):
+        self.__rate = rate
+        self.__cooldown = cooldown
+        self.__max_age = max_age
+        self.__queue = queue.PriorityQueue(maxsize=maxsize)
+        self.__counter = itertools.count()
+        self.__lock = threading.Lock()
+        self.__pending = set()  # phrases currently queued
+        self.__last_spoken = {}  # phrase -> time last spoken
+        self.__latest = {}  # priority -> sequence number of the newest queued phrase
+        self.__thread = None
+
+    def say(self, text, priority=BUS):
+        # Queue text without blocking, returns False if it was coalesced or dropped
+        if not text:
+            return False
+        now = time.monotonic()
+        with self.__lock:
+            if text in self.__pending or now - self.__last_spoken.get(text, -self.__cooldown) < self.__cooldown:
+                return False
+            seq = next(self.__counter)
+            try:
+                self.__queue.put_nowait((priority, seq, now, text))
+            except queue.Full:
+                print("'{}' dropped, speech queue full".format(text))
+                return False
+            self.__pending.add(text)
+            self.__latest[priority] = seq
+            if self.__thread is None or not self.__thread.is_alive():
+                self.__thread = threading.Thread(target=self.__run, daemon=True)
+                self.__thread.start()
+        return True
+
+    def __run(self):
+        import pyttsx3  # engine is created and used only on this thread
+
+        voice_engine = pyttsx3.init()
+        voice_engine.setProperty("rate", self.__rate)
+        while True:
+            priority, seq, queued_at, text = self.__queue.get()
+            with self.__lock:
+                self.__pending.discard(text)
+                stale = seq < self.__latest.get(priority, seq) or time.monotonic() - queued_at > self.__max_age
+            if stale:
+                continue
+            voice_engine.say(text)
+            print("'{}' being spoken".format(text))
+            voice_engine.runAndWait()
+            with self.__lock:
+                self.__last_spoken[text] = time.monotonic()
@@ -0,0 +1,79 @@
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+
+PROCESS_START = time.perf_counter()  # approximately when the app started importing
+
+
+class StartupProfiler:
+    """
+    Wall-clock timings of the app from start up to the first detected frame.
+    Modules imported through lazy_import() and stages such as model loading are timed once each, the first time
+    they happen, and mark() records milestones like "app_ready" or "first_frame" in seconds since start.
+    """
+
+    def __init__(self, start=PROCESS_START):
+        self.__start = start
+        self.__lock = threading.Lock()
+        self.__imports = {}  # module name -> seconds to import
+        self.__stages = {}  # stage name -> seconds, i.e. "load_model bus_trafficlight_21jul.pt"
+        self.__marks = {}  # milestone name -> seconds since start
+
+    def import_module(self, name):
+        t0 = time.perf_counter()
+        module = importlib.import_module(name)
+        with self.__lock:
+            self.__imports.setdefault(name, round(time.perf_counter() - t0, 4))
+        return module
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        yield
+        with self.__lock:
+            self.__stages.setdefault(name, round(time.perf_counter() - t0, 4))
+
+    def mark(self, name):
+        # Records only the first time a milestone is reached, so it is cheap to call per frame
+        if name in self.__marks:
+            return
+        with self.__lock:
+            self.__marks.setdefault(name, round(time.perf_counter() - self.__start, 4))
+
+    def return_json(self):
+        with self.__lock:
+            output = {
+                "uptime": round(time.perf_counter() - self.__start, 2),
+                "imports": dict(sorted(self.__imports.items(), key=lambda x: -x[1])),
+                "stages": dict(self.__stages),
+                "marks": dict(sorted(self.__marks.items(), key=lambda x: x[1]))
+            }
+        return output
+
+
+class LazyModule:
+    """
+    Stand-in for a heavy module that imports it on first attribute access, i.e. torch or cv2 are only imported once
+    a route needs them rather than when the app starts.
+    """
+
+    def __init__(self, name, profiler):
+        self._name = name
+        self._profiler = profiler
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = self._profiler.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+def lazy_import(name):
+    return LazyModule(name, startup_profiler)
+
+
+startup_profiler = StartupProfiler()
@@ -29,9 +29,10 @@ Usage - formats:
 """
 
 import argparse
-import json
 
-from classes.coco_json import Annotation, COCO, Image
+from classes.coco_json import COCOWriter
+from classes.frame_dedup import FrameDeduplicator
+from classes.inference_cache import InferenceCache
 import os
 import platform
 import sys
@@ -45,13 +46,14 @@ if str(ROOT) not in sys.path:
     sys.path.append(str(ROOT))  # add ROOT to PATH
 ROOT = Path(os.path.relpath(ROOT, Path.cwd()))  # relative
 
-from models.common import DetectMultiBackend
 from utils.dataloaders import IMG_FORMATS, VID_FORMATS, LoadImages, LoadScreenshots, LoadStreams
 from utils.general import (LOGGER, Profile, check_file, check_img_size, check_imshow, check_requirements, colorstr, cv2,
                            increment_path, non_max_suppression, print_args, scale_boxes, strip_optimizer, xyxy2xywh,
                            xyxy2x1y1wh)
 from utils.plots import Annotator, colors, save_one_box
-from utils.torch_utils import select_device, smart_inference_mode
+from utils.torch_utils import smart_inference_mode
+
+from classes.model_registry import model_registry
 
 from datetime import datetime
 from uuid import uuid4
@@ -86,7 +88,18 @@ def run(
         half=False,  # use FP16 half-precision inference
         dnn=False,  # use OpenCV DNN for ONNX inference
         vid_stride=1,  # video frame-rate stride
-        img_path=None
+        img_path=None,
+        coco_mode='per_image',  # COCO output: 'per_image' <image>.json next to each image, or 'single' file
+        batch_size=1,  # images/frames per inference call for file and video sources
+        scene_thres=None,  # video frames are only inferred when the scene changed this much (mean grey diff, 0-255)
+        max_gap=30,  # with scene_thres, infer at least every max_gap frames
+        progress=None,  # callable(decoded), called after every processed image/frame with images/frames read so far
+        stop_event=None,  # threading.Event, stop early when set, i.e. job cancelled
+        dedup=True,  # skip saving frames that are near-duplicates of a recently saved frame
+        dedup_distance=6,  # max dHash bit difference (of 64) for a near-duplicate frame
+        dedup_iou=0.7,  # min IoU between matching detections for a near-duplicate frame
+        cache_dir=None,  # reuse NMS outputs cached here for the same file, frame, model and settings
+        cache_mb=512,  # inference cache size limit
 ):
     source = str(source)
     save_img = not nosave and not source.endswith('.txt')  # save inference images
@@ -102,8 +115,7 @@ def run(
     (save_dir / 'labels' if save_txt else save_dir).mkdir(parents=True, exist_ok=True)  # make dir
 
     # Load model
-    device = select_device(device)
-    model = DetectMultiBackend(weights, device=device, dnn=dnn, data=data, fp16=half)
+    model = model_registry.get(weights, device=device, dnn=dnn, data=data, half=half)  # shared across runs
     stride, names, pt = model.stride, model.names, model.pt
     imgsz = check_img_size(imgsz, s=stride)  # check image size
 
@@ -116,13 +128,29 @@ def run(
     elif screenshot:
         dataset = LoadScreenshots(source, img_size=imgsz, stride=stride, auto=pt)
     else:
-        dataset = LoadImages(source, img_size=imgsz, stride=stride, auto=pt, vid_stride=vid_stride)
+        dataset = LoadImages(source, img_size=imgsz, stride=stride, auto=pt, vid_stride=vid_stride,
+                             batch_size=batch_size, scene_thres=scene_thres, max_gap=max_gap)
+        bs = batch_size
+    batched = not webcam and bs > 1  # LoadImages batches: lists of paths/im0s padded to bs, frames in batch_frames
     vid_path, vid_writer = [None] * bs, [None] * bs
 
+    # COCO labels are written incrementally, one small file per saved image or one file finalised at the end
+    Path(img_path).mkdir(parents=True, exist_ok=True)
+    coco_writer = COCOWriter(img_path, mode=coco_mode)
+    deduplicator = FrameDeduplicator(max_distance=dedup_distance, min_iou=dedup_iou) if dedup else None
+    cache = None
+    if cache_dir and not (webcam or screenshot):
+        cache = InferenceCache(cache_dir, str(weights[0] if isinstance(weights, list) else weights), conf_thres,
+                               max_mb=cache_mb, imgsz=imgsz, iou_thres=iou_thres, classes=classes,
+                               agnostic_nms=agnostic_nms, max_det=max_det, augment=augment,
+                               stride=stride, auto=dataset.auto)  # boxes are cached in letterboxed pixels
+
     # Run inference
     model.warmup(imgsz=(1 if pt or model.triton else bs, 3, *imgsz))  # warmup
     seen, windows, dt = 0, [], (Profile(), Profile(), Profile())
     for path, im, im0s, vid_cap, s in dataset:
+        if stop_event is not None and stop_event.is_set():
+            break
         with dt[0]:
             im = torch.from_numpy(im).to(model.device)
             im = im.half() if model.fp16 else im.float()  # uint8 to fp16/32
@@ -130,30 +158,41 @@ def run(
             if len(im.shape) == 3:
                 im = im[None]  # expand for batch dim
 
-        # Inference
-        with dt[1]:
-            visualize = increment_path(save_dir / Path(path).stem, mkdir=True) if visualize else False
-            pred = model(im, augment=augment, visualize=visualize)
-
-        # NMS
-        with dt[2]:
-            pred = non_max_suppression(pred, conf_thres, iou_thres, classes, agnostic_nms, max_det=max_det)
+        # Cached NMS outputs, keyed by file and absolute frame index
+        if cache is not None:
+            keys = list(zip(path, dataset.batch_frames)) if batched else [(path, getattr(dataset, 'frame', 0))]
+            keys = [(p, f * vid_stride if dataset.mode == 'video' else 0) for p, f in keys]
+            cached = [cache.get(*k) for k in keys]
+        hit = cache is not None and all(c is not None for c in cached)
+        if hit:
+            pred = [torch.from_numpy(c).to(model.device) for c in cached]
+        else:
+            # Inference
+            with dt[1]:
+                stem = Path(path[0] if batched else path).stem
+                visualize = increment_path(save_dir / stem, mkdir=True) if visualize else False
+                pred = model(im, augment=augment, visualize=visualize)
+
+            # NMS
+            with dt[2]:
+                pred = non_max_suppression(pred, conf_thres, iou_thres, classes, agnostic_nms, max_det=max_det)
+            if cache is not None:
+                for k, det in zip(keys, pred):
+                    cache.put(*k, det.cpu().numpy())
 
         # Second-stage classifier (optional)
         # pred = utils.general.apply_classifier(pred, classifier_model, im, im0s)
 
         # [WK] Boolean variable to check if a bus is detected
         is_bus = False
-        image_count = 0
-        label_count = 0
-        images = []
-        annotations = []
         # Process predictions
-        for i, det in enumerate(pred):  # per image
+        for i, det in enumerate(pred[:len(path)] if batched else pred):  # per image, skipping batch padding
             seen += 1
             if webcam:  # batch_size >= 1
                 p, im0, frame = path[i], im0s[i].copy(), dataset.count
                 s += f'{i}: '
+            elif batched:
+                p, im0, frame = path[i], im0s[i].copy(), dataset.batch_frames[i]
             else:
                 p, im0, frame = path, im0s.copy(), getattr(dataset, 'frame', 0)
 
@@ -176,23 +215,14 @@ def run(
                     n = (det[:, 5] == c).sum()  # detections per class
                     s += f"{n} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
 
-                # [WK] Set image path and initialize list of json
+                # [WK] Set image path and collect the COCO labels (category, x1y1wh box) of this image
                 image_id = uuid4().hex
-                list_json = []
-                image = Image(image_count, image_id + ".jpg", r_im0_shape[0], r_im0_shape[1])
-                images.append(image.return_json())
+                coco_labels = list(zip(det[:, 5].int().tolist(), xyxy2x1y1wh(det[:, :4]).tolist()))[::-1]
 
                 # Write results
                 for *xyxy, conf, cls in reversed(det):
                     # [WK] Set boolean variable when a bus is detected
                     is_bus = True
-                    # [WK] Write results to a Label Object
-                    # label_obj = Label(names[int(cls)], conf, xyxy, r_im0_shape[0], r_im0_shape[1])
-                    xywh = (xyxy2x1y1wh(torch.tensor(xyxy).view(1, 4))).view(-1).tolist()
-                    annotation = Annotation(label_count, image_count, int(cls), xywh)
-                    annotations.append(annotation.return_json())
-                    label_count += 1
-                    list_json.append(annotation.return_json())
 
                     if save_txt:  # Write to file
                         xywh = (xyxy2xywh(torch.tensor(xyxy).view(1, 4)) / gn).view(-1).tolist()  # normalized xywh
@@ -208,14 +238,9 @@ def run(
                         save_one_box(xyxy, imc, file=save_dir / 'crops' / names[c] / f'{p.stem}.jpg', BGR=True)
 
                 # [WK] Checks and saves frames with buses
-                if is_bus:
-                    cv2.imwrite(f'{img_path}\\{image_id}.jpg', r_im0)
-                    image_count += 1
-
-                final_json = COCO(images, annotations)
-                #print(final_json.return_json())
-                with open(f'{img_path}\\{image_id}.json', "w") as outfile:
-                    outfile.write(json.dumps(final_json.return_json(), indent=4))
+                if is_bus and (deduplicator is None or deduplicator.keep(r_im0, det)):
+                    cv2.imwrite(os.path.join(img_path, f'{image_id}.jpg'), r_im0)
+                    coco_writer.add_image(image_id + ".jpg", r_im0_shape[0], r_im0_shape[1], coco_labels)
 
             # Stream results
             im0 = annotator.result()
@@ -232,10 +257,11 @@ def run(
                 if dataset.mode == 'image':
                     cv2.imwrite(save_path, im0)
                 else:  # 'video' or 'stream'
-                    if vid_path[i] != save_path:  # new video
-                        vid_path[i] = save_path
-                        if isinstance(vid_writer[i], cv2.VideoWriter):
-                            vid_writer[i].release()  # release previous video writer
+                    v = i if webcam else 0  # one writer per stream, batched frames share the video's writer
+                    if vid_path[v] != save_path:  # new video
+                        vid_path[v] = save_path
+                        if isinstance(vid_writer[v], cv2.VideoWriter):
+                            vid_writer[v].release()  # release previous video writer
                         if vid_cap:  # video
                             fps = vid_cap.get(cv2.CAP_PROP_FPS)
                             w = int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -243,12 +269,29 @@ def run(
                         else:  # stream
                             fps, w, h = 30, im0.shape[1], im0.shape[0]
                         save_path = str(Path(save_path).with_suffix('.mp4'))  # force *.mp4 suffix on results videos
-                        vid_writer[i] = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
-                    vid_writer[i].write(im0)
+                        vid_writer[v] = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+                    vid_writer[v].write(im0)
 
         # Print time (inference-only)
-        LOGGER.info(f"{s}{'' if len(det) else '(no detections), '}{dt[1].dt * 1E3:.1f}ms")
-    return
+        LOGGER.info(f"{s}{'' if len(det) else '(no detections), '}{'cached' if hit else f'{dt[1].dt * 1E3:.1f}ms'}")
+        if progress is not None:
+            progress(getattr(dataset, 'decoded', seen))  # frames skipped by scene sampling count as done
+    coco_writer.close()
+
+    stats = {}
+    if cache is not None:
+        cache.flush()
+        stats.update(cache.get_stats())
+        LOGGER.info(f"Inference cache: {stats['cache_hits']} hits, {stats['cache_misses']} misses")
+    for video, counts in getattr(dataset, 'sample_stats', {}).items():
+        if scene_thres is not None:
+            LOGGER.info(f"{video}: inferred {counts['sampled']}/{counts['decoded']} frames")
+        stats['decoded'] = stats.get('decoded', 0) + counts['decoded']
+        stats['sampled'] = stats.get('sampled', 0) + counts['sampled']
+    if deduplicator is not None:
+        stats.update(deduplicator.get_stats())
+        LOGGER.info(f"Saved {stats['kept']} frames, dropped {stats['dropped']} near-duplicates")
+    return stats
 
 
 def parse_opt():
@@ -280,6 +323,16 @@ def parse_opt():
     parser.add_argument('--half', action='store_true', help='use FP16 half-precision inference')
     parser.add_argument('--dnn', action='store_true', help='use OpenCV DNN for ONNX inference')
     parser.add_argument('--vid-stride', type=int, default=1, help='video frame-rate stride')
+    parser.add_argument('--img-path', type=str, default=ROOT / 'runs/label', help='folder for labelled images and COCO json')
+    parser.add_argument('--batch-size', type=int, default=1, help='images/frames per inference call')
+    parser.add_argument('--scene-thres', type=float, default=None, help='adaptive video sampling, min mean grey diff')
+    parser.add_argument('--max-gap', type=int, default=30, help='with --scene-thres, max frames between inferences')
+    parser.add_argument('--cache-dir', type=str, default=None, help='reuse NMS outputs cached in this folder')
+    parser.add_argument('--cache-mb', type=int, default=512, help='inference cache size limit (MB)')
+    parser.add_argument('--no-dedup', dest='dedup', action='store_false', help='save near-duplicate frames too')
+    parser.add_argument('--dedup-distance', type=int, default=6, help='max dHash bit difference for a duplicate')
+    parser.add_argument('--dedup-iou', type=float, default=0.7, help='min detection IoU for a duplicate')
+    parser.add_argument('--coco-mode', type=str, default='per_image', choices=['per_image', 'single'], help='COCO output')
     opt = parser.parse_args()
     opt.imgsz *= 2 if len(opt.imgsz) == 1 else 1  # expand
     print_args(vars(opt))
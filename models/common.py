@@ -314,7 +314,16 @@ class Concat(nn.Module):
 
 class DetectMultiBackend(nn.Module):
     # YOLOv5 MultiBackend class for python inference on various backends
-    def __init__(self, weights='yolov5s.pt', device=torch.device('cpu'), dnn=False, data=None, fp16=False, fuse=True):
+    def __init__(self,
+                 weights='yolov5s.pt',
+                 device=torch.device('cpu'),
+                 dnn=False,
+                 data=None,
+                 fp16=False,
+                 fuse=True,
+                 autobackend=False,
+                 imgsz=(640, 640),
+                 fastload=False):
         # Usage:
         #   PyTorch:              weights = *.pt
         #   TorchScript:                    *.torchscript
@@ -328,10 +337,18 @@ class DetectMultiBackend(nn.Module):
         #   TensorFlow Lite:                *.tflite
         #   TensorFlow Edge TPU:            *_edgetpu.tflite
         #   PaddlePaddle:                   *_paddle_model
+        #   Fastest CPU backend:            *.pt --autobackend, exported and benchmarked at imgsz on first use
+        #   Pre-fused / traced:             *.pt --fastload fused|torchscript, saved next to the weights on first use
         from models.experimental import attempt_download, attempt_load  # scoped to avoid circular import
 
         super().__init__()
         w = str(weights[0] if isinstance(weights, list) else weights)
+        if autobackend and device.type == 'cpu' and not dnn and not isinstance(weights, list):
+            from utils.autobackend import autobackend as select_backend  # scoped to avoid circular import
+            w = weights = str(select_backend(w, imgsz=imgsz))
+        if fastload and not isinstance(weights, list):
+            from utils.fastload import fastload as fast_artifact  # scoped to avoid circular import
+            w = weights = str(fast_artifact(w, mode=fastload, imgsz=imgsz, device=device))
         pt, jit, onnx, xml, engine, coreml, saved_model, pb, tflite, edgetpu, tfjs, paddle, triton = self._model_type(w)
         fp16 &= pt or jit or onnx or engine  # FP16
         nhwc = coreml or saved_model or pb or tflite or edgetpu  # BHWC formats (vs torch BCWH)
@@ -341,7 +358,8 @@ class DetectMultiBackend(nn.Module):
             w = attempt_download(w)  # download if not local
 
         if pt:  # PyTorch
-            model = attempt_load(weights if isinstance(weights, list) else w, device=device, inplace=True, fuse=fuse)
+            model = attempt_load(weights if isinstance(weights, list) else w, device=device, inplace=True, fuse=fuse,
+                                 mmap=bool(fastload))
             stride = max(int(model.stride.max()), 32)  # model stride
             names = model.module.names if hasattr(model, 'module') else model.names  # get class names
             model.half() if fp16 else model.float()
@@ -9,6 +9,7 @@ import torch
 import torch.nn as nn
 
 from utils.downloads import attempt_download
+from utils.fastload import MMAP
 
 
 class Sum(nn.Module):
@@ -70,13 +71,19 @@ class Ensemble(nn.ModuleList):
         return y, None  # inference, train output
 
 
-def attempt_load(weights, device=None, inplace=True, fuse=True):
+def attempt_load(weights, device=None, inplace=True, fuse=True, mmap=False):
     # Loads an ensemble of models weights=[a,b,c] or a single model weights=[a] or weights=a
+    # mmap=True memory-maps the checkpoints on torch>=2.1, falling back to a normal load for legacy files
     from models.yolo import Detect, Model
 
     model = Ensemble()
     for w in weights if isinstance(weights, list) else [weights]:
-        ckpt = torch.load(attempt_download(w), map_location='cpu')  # load
+        w = attempt_download(w)
+        try:
+            ckpt = torch.load(w, map_location='cpu', mmap=True) if mmap and MMAP else torch.load(w, map_location='cpu')
+        except RuntimeError:  # not a zipfile checkpoint
+            ckpt = torch.load(w, map_location='cpu')
+        fused = ckpt.get('fused', False)  # saved by utils.fastload, already fused and in eval mode
         ckpt = (ckpt.get('ema') or ckpt['model']).to(device).float()  # FP32 model
 
         # Model compatibility updates
@@ -85,7 +92,7 @@ def attempt_load(weights, device=None, inplace=True, fuse=True):
         if hasattr(ckpt, 'names') and isinstance(ckpt.names, (list, tuple)):
             ckpt.names = dict(enumerate(ckpt.names))  # convert to dict
 
-        model.append(ckpt.fuse().eval() if fuse and hasattr(ckpt, 'fuse') else ckpt.eval())  # model in eval mode
+        model.append(ckpt.fuse().eval() if fuse and not fused and hasattr(ckpt, 'fuse') else ckpt.eval())  # model in eval mode
 
     # Module compatibility updates
     for m in model.modules():
@@ -0,0 +1,174 @@
+# YOLOv5 🚀 by Ultralytics, AGPL-3.0 license
+"""
+INT8 post-training static quantization of a YOLOv5 PyTorch model for ONNX Runtime CPU inference, calibrated on a
+sample of the dataset's training images, with an FP32 vs INT8 report of mAP, latency and size from val.py
+
+Requirements:
+    $ pip install -r requirements.txt onnx onnxruntime
+
+Usage:
+    $ python quantize.py --weights instance/models/bus_trafficlight_21jul.pt --data data.yaml --img 640
+
+Output:
+    bus_trafficlight_21jul.onnx             # FP32 ONNX
+    bus_trafficlight_21jul_int8.onnx        # INT8 ONNX (QDQ), loads in DetectMultiBackend like any *.onnx
+    bus_trafficlight_21jul_int8.json        # FP32 vs INT8 report
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+FILE = Path(__file__).resolve()
+ROOT = FILE.parents[0]  # YOLOv5 root directory
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))  # add ROOT to PATH
+ROOT = Path(os.path.relpath(ROOT, Path.cwd()))  # relative
+
+from export import run as export
+from utils.dataloaders import IMG_FORMATS, letterbox
+from utils.general import LOGGER, check_dataset, check_requirements, colorstr, cv2, file_size, print_args
+from val import run as val_det
+
+
+def calibration_batches(files, imgsz=640, stride=32):
+    # Letterboxed, normalised (1, 3, h, w) float32 batches of calibration images, as LoadImages prepares them
+    for f in files:
+        im0 = cv2.imread(f)  # BGR
+        if im0 is None:
+            continue
+        im = letterbox(im0, imgsz, stride=stride, auto=False)[0]  # padded resize
+        im = im.transpose((2, 0, 1))[::-1]  # HWC to CHW, BGR to RGB
+        yield np.ascontiguousarray(im, dtype=np.float32)[None] / 255
+
+
+def calibration_files(data, n=300, seed=0):
+    # Random sample of n images from the dataset's train split
+    train = data['train'] if isinstance(data['train'], list) else [data['train']]
+    files = sorted(f for d in train for f in glob.glob(os.path.join(d, '*.*'))
+                   if f.split('.')[-1].lower() in IMG_FORMATS)
+    assert files, f'No training images found in {train} for calibration'
+    return random.Random(seed).sample(files, min(n, len(files)))
+
+
+def head_nodes(model_onnx):
+    # Non-Conv nodes of the Detect head (the last model.N module), i.e. sigmoid, grid and anchor arithmetic, which
+    # lose box precision when quantized and stay in FP32
+    def index(node):
+        m = re.search(r'/model\.(\d+)/', node.name)
+        return int(m.group(1)) if m else -1
+
+    last = max(index(node) for node in model_onnx.graph.node)
+    return [node.name for node in model_onnx.graph.node if index(node) == last and node.op_type != 'Conv']
+
+
+def quantize(fp32, int8, data, imgsz=640, calib_images=300, per_channel=True):
+    # Static QDQ quantization of an FP32 ONNX model, calibrated on sampled training images
+    import onnx
+    import onnxruntime
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    model_onnx = onnx.load(fp32)
+    meta = {p.key: p.value for p in model_onnx.metadata_props}
+    stride = int(meta.get('stride', 32))
+    input_name = onnxruntime.InferenceSession(fp32, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    files = calibration_files(data, calib_images)
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.batches = calibration_batches(files, imgsz, stride)
+
+        def get_next(self):
+            im = next(self.batches, None)
+            return None if im is None else {input_name: im}
+
+    reader = Reader()
+    quantize_static(fp32,
+                    int8,
+                    reader,
+                    quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8,
+                    per_channel=per_channel,
+                    nodes_to_exclude=head_nodes(model_onnx))
+
+    # Keep stride and class names so DetectMultiBackend loads the INT8 model like the FP32 one
+    model_int8 = onnx.load(int8)
+    existing = {p.key for p in model_int8.metadata_props}
+    for k, v in meta.items():
+        if k in existing:
+            continue
+        p = model_int8.metadata_props.add()
+        p.key, p.value = k, v
+    onnx.save(model_int8, int8)
+    return int8
+
+
+def run(
+        weights=ROOT / 'yolov5s.pt',  # PyTorch weights path
+        data=ROOT / 'data.yaml',  # dataset.yaml path, train images calibrate and val images evaluate
+        imgsz=640,  # inference size (pixels)
+        calib_images=300,  # number of sampled training images for calibration
+        per_channel=True,  # per-channel weight quantization
+        conf_thres=0.001,  # val.py confidence threshold
+        iou_thres=0.6,  # val.py NMS IoU threshold
+):
+    check_requirements(('onnx', 'onnxruntime'))
+    prefix = colorstr('Quantize: ')
+    weights = Path(weights)
+    data = check_dataset(data)
+
+    # FP32 ONNX, static shape
+    fp32 = export(weights=weights, imgsz=[imgsz, imgsz], batch_size=1, device='cpu', include=('onnx',))[-1]
+    int8 = str(weights.with_name(f'{weights.stem}_int8.onnx'))
+    LOGGER.info(f'{prefix}calibrating on {calib_images} images from {data["train"]}...')
+    quantize(fp32, int8, data, imgsz=imgsz, calib_images=calib_images, per_channel=per_channel)
+
+    # FP32 vs INT8 validation
+    y = []
+    for name, w in (('FP32', fp32), ('INT8', int8)):
+        (mp, mr, map50, map, *_), _, t = val_det(data, weights=w, batch_size=1, imgsz=imgsz, conf_thres=conf_thres,
+                                                 iou_thres=iou_thres, device='cpu', half=False, plots=False)
+        y.append([name, file_size(w), map50, map, t[1]])  # t = (pre-process, inference, NMS) ms per image
+    py = pd.DataFrame(y, columns=['Model', 'Size (MB)', 'mAP50', 'mAP50-95', 'Inference time (ms)'])
+    delta = {
+        'size_mb': round(py['Size (MB)'][1] - py['Size (MB)'][0], 2),
+        'map50': round(py['mAP50'][1] - py['mAP50'][0], 4),
+        'map50_95': round(py['mAP50-95'][1] - py['mAP50-95'][0], 4),
+        'inference_ms': round(py['Inference time (ms)'][1] - py['Inference time (ms)'][0], 2)}
+    report = Path(int8).with_suffix('.json')
+    report.write_text(json.dumps({'fp32': fp32, 'int8': int8, 'results': py.to_dict('records'), 'delta': delta},
+                                 indent=2))
+    LOGGER.info(f'\n{prefix}FP32 vs INT8 ONNX Runtime CPU\n{py.round(4)}\nDelta: {delta}\nReport saved to {report}')
+    return py
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', type=str, default=ROOT / 'yolov5s.pt', help='PyTorch weights path')
+    parser.add_argument('--data', type=str, default=ROOT / 'data.yaml', help='dataset.yaml path')
+    parser.add_argument('--imgsz', '--img', '--img-size', type=int, default=640, help='inference size (pixels)')
+    parser.add_argument('--calib-images', type=int, default=300, help='training images sampled for calibration')
+    parser.add_argument('--no-per-channel', dest='per_channel', action='store_false', help='per-tensor weights')
+    parser.add_argument('--conf-thres', type=float, default=0.001, help='val.py confidence threshold')
+    parser.add_argument('--iou-thres', type=float, default=0.6, help='val.py NMS IoU threshold')
+    opt = parser.parse_args()
+    print_args(vars(opt))
+    return opt
+
+
+def main(opt):
+    run(**vars(opt))
+
+
+if __name__ == '__main__':
+    opt = parse_opt()
+    main(opt)
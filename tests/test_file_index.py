@@ -0,0 +1,27 @@
+import os
+
+from classes.file_index import FileIndex
+
+
+def test_file_overwritten_in_place_is_read_again(tmp_path):
+    reads = []
+
+    def extractor(path):
+        reads.append(path)
+        with open(path) as f:
+            return {"type": "weights", "version": f.read()}
+
+    weights = tmp_path / "bus_trafficlight_21jul.pt"
+    weights.write_text("v1")
+    os.utime(weights, (1, 1))
+    index = FileIndex(str(tmp_path), (".pt",), extractor=extractor)
+    assert index.get("bus_trafficlight_21jul.pt")["version"] == "v1"
+    assert index.get("bus_trafficlight_21jul.pt")["version"] == "v1"
+    assert len(reads) == 1  # unchanged files are not read again
+
+    dir_mtime = os.stat(tmp_path).st_mtime_ns
+    weights.write_text("v2")  # copied over the old weights, the directory mtime does not change
+    os.utime(weights, (2, 2))
+    assert os.stat(tmp_path).st_mtime_ns == dir_mtime
+    assert index.get("bus_trafficlight_21jul.pt")["version"] == "v2"
+    assert len(reads) == 2
@@ -0,0 +1,45 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from classes.inference_cache import InferenceCache
+
+
+def run(cache, frames):
+    # Boxes written for each frame, scaled in place after put() as label_automation.run does
+    boxes = {}
+    for frame, letterboxed in frames.items():
+        det = cache.get("clip.mp4", frame)
+        if det is None:
+            det = letterboxed.copy()
+            cache.put("clip.mp4", frame, det)
+        det[:, :4] *= 2  # scale_boxes to the original image
+        boxes[frame] = det.tolist()
+    cache.flush()
+    return boxes
+
+
+def test_second_run_writes_same_boxes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "clip.mp4").write_bytes(b"video")
+    (tmp_path / "best.pt").write_bytes(b"weights")
+    frames = {
+        0: np.array([[10, 20, 30, 40, 0.9, 1]], dtype=np.float32),
+        5: np.array([[1, 2, 3, 4, 0.8, 0], [5, 6, 7, 8, 0.7, 2]], dtype=np.float32)}
+
+    first = run(InferenceCache(str(tmp_path / "cache"), "best.pt", 0.25), frames)
+    cache = InferenceCache(str(tmp_path / "cache"), "best.pt", 0.25)
+    second = run(cache, frames)
+    assert cache.get_stats()["cache_hits"] == len(frames)
+    assert second == first
+
+
+def test_higher_conf_thres_filters_cached_results(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "clip.mp4").write_bytes(b"video")
+    cache = InferenceCache(str(tmp_path / "cache"), "best.pt", 0.25)
+    cache.put("clip.mp4", 0, np.array([[0, 0, 1, 1, 0.9, 0], [0, 0, 1, 1, 0.3, 1]], dtype=np.float32))
+    cache.flush()
+
+    det = InferenceCache(str(tmp_path / "cache"), "best.pt", 0.5).get("clip.mp4", 0)
+    assert det.tolist() == [[0, 0, 1, 1, pytest.approx(0.9), 0]]
@@ -0,0 +1,38 @@
+import json
+import threading
+
+from classes.job_queue import DONE, JobQueue
+
+
+def test_checkpoint_survives_restart(tmp_path):
+    store = str(tmp_path / "jobs.json")
+    interrupted = threading.Event()
+
+    def first(params, job):
+        job.save_checkpoint(files=["a.mp4"])
+        interrupted.set()
+        threading.Event().wait()  # the app stops here, before the job finishes
+
+    JobQueue(store, {"predict": first}).submit("predict", {"vid": "folder"})
+    assert interrupted.wait(5)
+    with open(store) as f:
+        assert json.load(f)[0]["checkpoint"] == {"files": ["a.mp4"]}
+
+    resumed = []
+    finished = threading.Event()
+
+    def second(params, job):
+        resumed.append(job.checkpoint)
+        finished.set()
+
+    jobs = JobQueue(store, {"predict": second})
+    jobs.start()
+    assert finished.wait(5)
+    assert resumed == [{"files": ["a.mp4"]}]
+    job = jobs.list()[0]
+    for _ in range(50):
+        if job["status"] == DONE:
+            break
+        finished.wait(0.1)
+        job = jobs.list()[0]
+    assert job["status"] == DONE
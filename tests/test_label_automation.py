@@ -0,0 +1,58 @@
+import glob
+import json
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+cv2 = pytest.importorskip("cv2")
+np = pytest.importorskip("numpy")
+
+import label_automation
+from models.yolo import Model
+
+
+@pytest.fixture
+def weights(tmp_path):
+    # Untrained YOLOv5n, saved the way attempt_load() expects a checkpoint
+    model = Model("models/yolov5n.yaml", nc=2).eval()
+    model.names = {0: "bus", 1: "traffic light"}
+    path = tmp_path / "untrained.pt"
+    torch.save({"model": model}, path)
+    return str(path)
+
+
+@pytest.fixture
+def source(tmp_path):
+    # Non-square images, so letterboxing and scale_boxes() matter
+    rng = np.random.default_rng(0)
+    folder = tmp_path / "images"
+    folder.mkdir()
+    for i in range(3):
+        cv2.imwrite(str(folder / f"{i}.jpg"), rng.integers(0, 255, (360, 640, 3), dtype=np.uint8))
+    return str(folder)
+
+
+def label(weights, source, out, tmp_path, batch_size):
+    stats = label_automation.run(weights=weights, source=source, img_path=str(out), project=str(tmp_path / "runs"),
+                                 nosave=True, conf_thres=1E-6, max_det=10, device="cpu", batch_size=batch_size,
+                                 dedup=False, cache_dir=str(tmp_path / "cache"))
+    boxes = []
+    for f in glob.glob(os.path.join(out, "*.json")):
+        with open(f) as json_file:
+            coco = json.load(json_file)
+        boxes += [(a["category_id"], [round(x, 3) for x in a["bbox"]]) for a in coco["annotations"]]
+    return stats, sorted(boxes)
+
+
+@pytest.mark.parametrize("batch_sizes", [(1, 1), (2, 2), (1, 2)])
+def test_rerun_from_cache_writes_same_boxes(weights, source, tmp_path, batch_sizes):
+    first_stats, first = label(weights, source, tmp_path / "first", tmp_path, batch_sizes[0])
+    second_stats, second = label(weights, source, tmp_path / "second", tmp_path, batch_sizes[1])
+    assert first
+    assert first_stats["cache_hits"] == 0
+    if batch_sizes[0] == batch_sizes[1]:
+        assert second_stats["cache_misses"] == 0  # every batch served from the cache
+        assert second == first
+    else:  # batched images are letterboxed to another shape, boxes cached at the old one must not be reused
+        assert second_stats["cache_hits"] == 0
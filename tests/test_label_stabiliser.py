@@ -0,0 +1,63 @@
+from classes.label_stabiliser import LabelStabiliser, VoteWindow
+
+
+def frame(light='', number=()):
+    return {'light': light, 'number': list(number)}
+
+
+def first_update(stabiliser, frames, key, value, expected=None):
+    # 1-based frame at which the stable label first holds value, None if it never does
+    for n, lbl_raw in enumerate(frames, 1):
+        label, _ = stabiliser.update(lbl_raw, expected)
+        if value == label[key] or (isinstance(label[key], list) and value in label[key]):
+            return n
+    return None
+
+
+def test_vote_window_hysteresis():
+    window = VoteWindow(size=5, on_votes=3, off_votes=2)
+    changes = [window.push(labels) for labels in (['a'], ['a'], ['a'], [], [], [], [])]
+    assert changes == [False, False, True, False, False, False, True]  # on at 3 votes, off below 2
+    assert window.get_active() == set()
+
+
+def test_vote_window_ignores_single_frame_blips():
+    window = VoteWindow(size=5, on_votes=3, off_votes=2)
+    for labels in (['a'], ['a'], ['a'], ['b'], [], ['a'], ['a']):  # b blips once, a drops out once
+        window.push(labels)
+        assert 'b' not in window.get_active()
+    assert window.get_active() == {'a'}
+
+
+def test_vote_window_fast_labels():
+    window = VoteWindow(size=5, on_votes=4, off_votes=1, fast_on_votes=2)
+    window.push(['a', 'b'], fast={'a'})
+    window.push(['a', 'b'], fast={'a'})
+    assert window.get_active() == {'a'}
+
+
+def test_light_path_is_faster_than_number_path():
+    frames = [frame('red', ['12'])] * 15
+    assert first_update(LabelStabiliser(), frames, 'light', 'red') == 2
+    assert first_update(LabelStabiliser(), frames, 'number', '12') == 10
+
+
+def test_light_blip_not_announced():
+    stabiliser = LabelStabiliser()
+    frames = [frame('red'), frame('red'), frame('green'), frame('red'), frame('red')]
+    assert [stabiliser.update(lbl_raw)[0]['light'] for lbl_raw in frames] == ['', 'red', 'red', 'red', 'red']
+
+
+def test_expected_routes_turn_on_at_6_votes():
+    frames = [frame(number=['12', '970'])] * 15
+    stabiliser = LabelStabiliser()
+    assert first_update(stabiliser, frames, 'number', '12', expected=['12']) == 6
+    assert stabiliser.get_label()['number'] == ['12']  # 970 is not expected, still needs 10 votes
+    assert first_update(LabelStabiliser(), frames, 'number', '970', expected=['12']) == 10
+
+
+def test_numbers_keep_left_to_right_order():
+    stabiliser = LabelStabiliser()
+    for _ in range(10):
+        label, _ = stabiliser.update(frame(number=['970', '12']))
+    assert label['number'] == ['970', '12']
@@ -0,0 +1,98 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+from classes.lta_api import ArrivalService, parse_arrivals
+
+
+def arrival(seconds):
+    return (datetime.now(timezone(timedelta(hours=8))) + timedelta(seconds=seconds)).isoformat(timespec="seconds")
+
+
+def payload():
+    # BusArrivalv2 response, DataMall leaves EstimatedArrival empty when there is no next bus
+    return {
+        "BusStopCode": "83139",
+        "Services": [
+            {"ServiceNo": "12", "NextBus": {"EstimatedArrival": arrival(60)},
+             "NextBus2": {"EstimatedArrival": arrival(600)}, "NextBus3": {"EstimatedArrival": ""}},
+            {"ServiceNo": "970", "NextBus": {"EstimatedArrival": arrival(300)},
+             "NextBus2": {"EstimatedArrival": ""}, "NextBus3": {"EstimatedArrival": ""}},
+            {"ServiceNo": "14", "NextBus": {"EstimatedArrival": arrival(120)}, "NextBus2": {}, "NextBus3": None},
+            {"ServiceNo": "15", "NextBus": {"EstimatedArrival": ""}}]}
+
+
+@pytest.fixture
+def datamall():
+    # Local stub of the DataMall BusArrivalv2 endpoint, counting requests per bus stop
+    requests_seen = []
+    delay = {"seconds": 0.0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append((self.path, self.headers.get("AccountKey")))
+            time.sleep(delay["seconds"])
+            body = json.dumps(payload()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/ltaodataservice", requests_seen, delay
+    server.shutdown()
+    server.server_close()
+
+
+def test_ttl_cache(datamall):
+    base_url, requests_seen, _ = datamall
+    service = ArrivalService("key", base_url=base_url, ttl=60)
+    for _ in range(5):
+        arrivals = service.get_arrivals("83139")
+    assert len(requests_seen) == 1
+    assert requests_seen[0] == ("/ltaodataservice/BusArrivalv2?BusStopCode=83139", "key")
+    assert [a.get_num() for a in arrivals] == ["12", "14", "970", "12"]  # sorted by estimated arrival
+
+    service.get_arrivals("83139", max_age=0)  # stale, fetched again
+    assert len(requests_seen) == 2
+
+
+def test_concurrent_callers_share_one_request(datamall):
+    base_url, requests_seen, delay = datamall
+    delay["seconds"] = 0.3
+    service = ArrivalService("key", base_url=base_url, ttl=60)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.get_arrivals("83139"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+    assert len(results) == 8
+    assert len(requests_seen) == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_parse_arrivals_skips_empty_estimates():
+    arrivals = parse_arrivals(payload())
+    assert sorted(a.get_num() for a in arrivals) == ["12", "12", "14", "970"]
+    assert parse_arrivals({}) == []
+
+
+def test_expected_services_within(datamall):
+    base_url, _, _ = datamall
+    service = ArrivalService("key", base_url=base_url)
+    assert service.expected_services("83139", within=180) == ["12", "14"]
+    assert service.expected_services("83139", within=900) == ["12", "14", "970"]
+    assert service.expected_services("00000", cached=True) is None  # never fetched, does not block
@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+
+from classes.roboflow_api import RoboflowAPI, RoboflowUploader, UploadManifest
+
+
+class FakeProject:
+    # Roboflow project whose upload() fails the first `failures` times for every image, and always for `broken` ones
+    id = "workspace/buses"
+
+    def __init__(self, failures=0, broken=()):
+        self.failures = failures
+        self.broken = set(broken)
+        self.attempts = {}
+        self.uploaded = []
+        self.lock = threading.Lock()
+
+    def upload(self, image_path, annotation_path=None):
+        with self.lock:
+            n = self.attempts[image_path] = self.attempts.get(image_path, 0) + 1
+            if n <= self.failures or os.path.basename(image_path) in self.broken:
+                raise ConnectionError("503 Service Unavailable")
+            self.uploaded.append((image_path, annotation_path))
+
+
+class FakeRoboflow:
+    def __init__(self, project):
+        self.project_ = project
+
+    def workspace(self):
+        return self
+
+    def project(self, project_id):
+        return self.project_
+
+
+class RecordingEvent(threading.Event):
+    # Records backoff waits instead of sleeping
+    def __init__(self):
+        super().__init__()
+        self.waits = []
+
+    def wait(self, timeout=None):
+        self.waits.append(timeout)
+        return self.is_set()
+
+
+def folder(tmp_path, n=3):
+    for i in range(n):
+        (tmp_path / f"{i}.jpg").write_bytes(f"image {i}".encode())
+        (tmp_path / f"{i}.json").write_text("{}")
+    return str(tmp_path)
+
+
+def test_retries_with_backoff_until_success(tmp_path, monkeypatch):
+    monkeypatch.setattr("classes.roboflow_api.random.uniform", lambda a, b: 0)
+    project = FakeProject(failures=2)
+    stop_event = RecordingEvent()
+    uploader = RoboflowUploader(project, UploadManifest(str(tmp_path / "manifest.jsonl")), workers=1, retries=4,
+                                backoff=0.5)
+    (tmp_path / "images").mkdir()
+    counts = uploader.upload(folder(tmp_path / "images", n=1), stop_event=stop_event)
+    assert counts == {"uploaded": 1, "skipped": 0, "failed": 0}
+    assert stop_event.waits == [0.5, 1.0]  # exponential backoff between the three attempts
+    assert project.uploaded[0][1].endswith("0.json")  # per-image COCO file sent with the image
+
+
+def test_gives_up_after_retries(tmp_path):
+    project = FakeProject(failures=10)
+    manifest = UploadManifest(str(tmp_path / "manifest.jsonl"))
+    (tmp_path / "images").mkdir()
+    counts = RoboflowUploader(project, manifest, retries=2, backoff=0).upload(folder(tmp_path / "images"),
+                                                                            stop_event=RecordingEvent())
+    assert counts == {"uploaded": 0, "skipped": 0, "failed": 3}
+    assert all(n == 3 for n in project.attempts.values())
+    assert len(manifest) == 0
+
+
+def test_manifest_written_per_image_and_rerun_skips_sent(tmp_path):
+    (tmp_path / "images").mkdir()
+    images = folder(tmp_path / "images")
+    manifest_path = str(tmp_path / "manifest.jsonl")
+    project = FakeProject(failures=1)
+    api = RoboflowAPI("key", rf=FakeRoboflow(project))
+    api.set_project("buses")
+
+    progress = []
+    counts = api.upload_image(images, manifest_path=manifest_path, stop_event=RecordingEvent(),
+                              progress=lambda done, total, **c: progress.append((done, total)))
+    assert counts == {"uploaded": 3, "skipped": 0, "failed": 0}
+    assert progress[-1] == (3, 3)
+    with open(manifest_path) as f:
+        lines = [json.loads(line) for line in f]
+    assert sorted(line["file"] for line in lines) == ["0.jpg", "1.jpg", "2.jpg"]
+    assert {line["project"] for line in lines} == {"workspace/buses"}
+
+    (tmp_path / "images" / "3.jpg").write_bytes(b"image 3")  # new frame since the first upload
+    counts = api.upload_image(images, manifest_path=manifest_path, stop_event=RecordingEvent())
+    assert counts == {"uploaded": 1, "skipped": 3, "failed": 0}
+    assert len(project.uploaded) == 4
+
+
+def test_interrupted_upload_resumes_from_manifest(tmp_path):
+    (tmp_path / "images").mkdir()
+    images = folder(tmp_path / "images")
+    manifest_path = str(tmp_path / "manifest.jsonl")
+    project = FakeProject(broken={"1.jpg"})  # i.e. the connection dropped while 1.jpg was being sent
+    counts = RoboflowUploader(project, UploadManifest(manifest_path), retries=1, backoff=0).upload(
+        images, stop_event=RecordingEvent())
+    assert counts == {"uploaded": 2, "skipped": 0, "failed": 1}
+    with open(manifest_path) as f:
+        assert sorted(json.loads(line)["file"] for line in f) == ["0.jpg", "2.jpg"]  # one line per sent image
+
+    project.broken.clear()
+    counts = RoboflowUploader(project, UploadManifest(manifest_path), backoff=0).upload(images,
+                                                                                    stop_event=RecordingEvent())
+    assert counts == {"uploaded": 1, "skipped": 2, "failed": 0}
+    assert sorted(os.path.basename(p) for p, _ in project.uploaded) == ["0.jpg", "1.jpg", "2.jpg"]
+
+
+def test_manifest_ignores_partly_written_line(tmp_path):
+    path = tmp_path / "manifest.jsonl"
+    path.write_text(json.dumps({"project": "p", "sha1": "a", "file": "0.jpg"}) + '\n{"project": "p", "sh')
+    manifest = UploadManifest(str(path))
+    assert manifest.contains("p", "a")
+    assert len(manifest) == 1
@@ -0,0 +1,122 @@
+# YOLOv5 🚀 by Ultralytics, AGPL-3.0 license
+"""
+Auto-backend utils
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from utils.general import LOGGER, colorstr
+
+CANDIDATES = {  # backend: (--include argument, modules needed to export and run it)
+    'onnx': ('onnx', ('onnx', 'onnxruntime')),
+    'openvino': ('openvino', ('onnx', 'openvino', 'openvino.tools.mo')),}
+
+
+def cpu_signature():
+    # Short hash of the CPU, thread count and runtime versions, a cached benchmark is only valid for the same one
+    s = f'{platform.machine()}|{platform.processor()}|{os.cpu_count()}|{torch.get_num_threads()}|{torch.__version__}'
+    return hashlib.sha1(s.encode()).hexdigest()[:12]
+
+
+def file_hash(file):
+    h = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+def available_backends():
+    # CPU backends whose export and runtime dependencies are installed, nothing is installed on demand
+    def found(module):
+        try:
+            return importlib.util.find_spec(module) is not None
+        except ModuleNotFoundError:  # parent package missing
+            return False
+
+    return [k for k, (_, modules) in CANDIDATES.items() if all(found(m) for m in modules)]
+
+
+def benchmark(weights, imgsz=(640, 640), batch_size=1, n=10):
+    # Median CPU latency (ms) of one forward pass of exported or PyTorch weights
+    from models.common import DetectMultiBackend  # scoped to avoid circular import
+
+    model = DetectMultiBackend(weights, device=torch.device('cpu'))
+    im = torch.zeros(batch_size, 3, *imgsz)
+    for _ in range(2):
+        model(im)  # warmup
+    t = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        model(im)
+        t.append(time.perf_counter() - t0)
+    return float(np.median(t)) * 1E3
+
+
+def autobackend(weights, imgsz=(640, 640), batch_size=1, cache_dir=None, n=10):
+    # Fastest CPU backend for PyTorch weights, exported once and cached per weights hash and CPU signature
+    # Usage:
+    #     from utils.autobackend import autobackend
+    #     w = autobackend('yolov5s.pt', imgsz=(640, 640))  # i.e. 'yolov5s_autobackend/1f2e..._openvino_model'
+    #     model = DetectMultiBackend(w)
+    prefix = colorstr('AutoBackend: ')
+    weights = Path(weights)
+    if weights.suffix != '.pt' or not weights.is_file():
+        return weights
+    imgsz = (imgsz, imgsz) if isinstance(imgsz, int) else tuple(imgsz)
+    cache_dir = Path(cache_dir or weights.parent / f'{weights.stem}_autobackend')
+    key = f'{file_hash(weights)}_{cpu_signature()}_{imgsz[0]}x{imgsz[1]}_b{batch_size}'
+    cache_file = cache_dir / 'autobackend.json'
+    cache = json.loads(cache_file.read_text()) if cache_file.is_file() else {}
+    if key in cache and Path(cache[key]['weights']).exists():
+        LOGGER.info(f"{prefix}using cached {cache[key]['backend']} backend for {weights.name}")
+        return Path(cache[key]['weights'])
+
+    # Export to every available backend with dynamic axes, so other image and batch sizes still run
+    from export import run as export  # scoped to avoid circular import
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    source = cache_dir / f'{key.split("_")[0]}.pt'  # exports are written next to their source weights
+    shutil.copy2(weights, source)
+    candidates = {'pytorch': str(weights)}
+    for backend in available_backends():
+        try:
+            f = export(weights=source, imgsz=list(imgsz), batch_size=batch_size, device='cpu',
+                       include=(CANDIDATES[backend][0],), dynamic=True)
+            if f:
+                candidates[backend] = f[-1]
+        except Exception as e:
+            LOGGER.warning(f'{prefix}WARNING ⚠️ {backend} export failed: {e}')
+    source.unlink(missing_ok=True)
+
+    # Benchmark
+    latency = {}
+    for backend, f in candidates.items():
+        try:
+            latency[backend] = benchmark(f, imgsz, batch_size, n=n)
+            LOGGER.info(f'{prefix}{backend} {latency[backend]:.1f}ms at {(batch_size, 3, *imgsz)}')
+        except Exception as e:
+            LOGGER.warning(f'{prefix}WARNING ⚠️ {backend} benchmark failed: {e}')
+    best = min(latency, key=latency.get) if latency else 'pytorch'
+    for backend, f in candidates.items():  # keep only the winning artifact
+        if backend in (best, 'pytorch'):
+            continue
+        if Path(f).is_dir():
+            shutil.rmtree(f, ignore_errors=True)
+        else:
+            Path(f).unlink(missing_ok=True)
+
+    cache[key] = {'backend': best, 'weights': candidates[best], 'latency_ms': latency, 'date': time.time()}
+    cache_file.write_text(json.dumps(cache, indent=2))
+    LOGGER.info(f'{prefix}using {best} backend for {weights.name} ✅')
+    return Path(candidates[best])
@@ -15,7 +15,7 @@ import time
 from itertools import repeat
 from multiprocessing.pool import Pool, ThreadPool
 from pathlib import Path
-from threading import Thread
+from threading import Condition, Thread
 from urllib.parse import urlparse
 
 import numpy as np
@@ -238,7 +238,21 @@ class LoadScreenshots:
 
 class LoadImages:
     # YOLOv5 image/video dataloader, i.e. `python detect.py --source image.jpg/vid.mp4`
-    def __init__(self, path, img_size=640, stride=32, auto=True, transforms=None, vid_stride=1):
+    # batch_size > 1 returns (paths, im (batch_size, 3, h, w), im0s, cap, s) like LoadStreams, padding the final
+    # partial batch by repeating its last image, len(paths) is the number of real images and batch_frames their frames
+    # scene_thres samples video frames adaptively: a frame is returned only when its mean absolute difference from the
+    # last returned frame (grey, downscaled to scene_size) reaches scene_thres (0-255) or max_gap frames have passed
+    def __init__(self,
+                 path,
+                 img_size=640,
+                 stride=32,
+                 auto=True,
+                 transforms=None,
+                 vid_stride=1,
+                 batch_size=1,
+                 scene_thres=None,
+                 max_gap=30,
+                 scene_size=(64, 36)):
         if isinstance(path, str) and Path(path).suffix == '.txt':  # *.txt file with img/vid/dir on each line
             path = Path(path).read_text().rsplit()
         files = []
@@ -263,9 +277,16 @@ class LoadImages:
         self.nf = ni + nv  # number of files
         self.video_flag = [False] * ni + [True] * nv
         self.mode = 'image'
-        self.auto = auto
+        self.auto = auto and batch_size == 1  # batched images need a common shape
         self.transforms = transforms  # optional
         self.vid_stride = vid_stride  # video frame-rate stride
+        self.batch_size = batch_size
+        self.batch_frames = []
+        self.scene_thres = scene_thres
+        self.max_gap = max_gap
+        self.scene_size = scene_size
+        self.decoded = 0  # images and video frames read, returned or not
+        self.sample_stats = {}  # video path -> {'decoded', 'sampled'}
         if any(videos):
             self._new_video(videos[0])  # new video
         else:
@@ -278,6 +299,25 @@ class LoadImages:
         return self
 
     def __next__(self):
+        if self.batch_size == 1:
+            return self._next_one()
+        paths, ims, im0s, s = [], [], [], ''
+        self.batch_frames = []
+        while len(ims) < self.batch_size:
+            try:
+                path, im, im0, _, s = self._next_one()
+            except StopIteration:
+                if not ims:
+                    raise
+                break
+            paths.append(path)
+            ims.append(im)
+            im0s.append(im0)
+            self.batch_frames.append(self.frame if self.mode == 'video' else 0)
+        im = np.stack(ims + [ims[-1]] * (self.batch_size - len(ims)))  # pad final partial batch
+        return paths, im, im0s, self.cap, s
+
+    def _next_one(self):
         if self.count == self.nf:
             raise StopIteration
         path = self.files[self.count]
@@ -285,25 +325,30 @@ class LoadImages:
         if self.video_flag[self.count]:
             # Read video
             self.mode = 'video'
-            for _ in range(self.vid_stride):
-                self.cap.grab()
-            ret_val, im0 = self.cap.retrieve()
-            while not ret_val:
-                self.count += 1
-                self.cap.release()
-                if self.count == self.nf:  # last video
-                    raise StopIteration
-                path = self.files[self.count]
-                self._new_video(path)
-                ret_val, im0 = self.cap.read()
-
-            self.frame += 1
+            while True:
+                for _ in range(self.vid_stride):
+                    self.cap.grab()
+                ret_val, im0 = self.cap.retrieve()
+                while not ret_val:
+                    self.count += 1
+                    self.cap.release()
+                    if self.count == self.nf:  # last video
+                        raise StopIteration
+                    path = self.files[self.count]
+                    self._new_video(path)
+                    ret_val, im0 = self.cap.read()
+
+                self.frame += 1
+                self.decoded += 1
+                if self._sample(path, im0):
+                    break
             # im0 = self._cv2_rotate(im0)  # for use if cv2 autorotation is False
             s = f'video {self.count + 1}/{self.nf} ({self.frame}/{self.frames}) {path}: '
 
         else:
             # Read image
             self.count += 1
+            self.decoded += 1
             im0 = cv2.imread(path)  # BGR
             assert im0 is not None, f'Image Not Found {path}'
             s = f'image {self.count}/{self.nf} {path}: '
@@ -317,9 +362,23 @@ class LoadImages:
 
         return path, im, im0, self.cap, s
 
+    def _sample(self, path, im0):
+        # True if this video frame should be returned, always True without scene_thres
+        stats = self.sample_stats.setdefault(path, {'decoded': 0, 'sampled': 0})
+        stats['decoded'] += 1
+        if self.scene_thres is not None:
+            small = cv2.resize(cv2.cvtColor(im0, cv2.COLOR_BGR2GRAY), self.scene_size, interpolation=cv2.INTER_AREA)
+            changed = self.last_sampled is None or cv2.absdiff(small, self.last_sampled).mean() >= self.scene_thres
+            if not changed and self.frame - self.last_sampled_frame < self.max_gap:
+                return False
+            self.last_sampled, self.last_sampled_frame = small, self.frame
+        stats['sampled'] += 1
+        return True
+
     def _new_video(self, path):
         # Create a new video capture object
         self.frame = 0
+        self.last_sampled, self.last_sampled_frame = None, 0  # scene_thres reference frame
         self.cap = cv2.VideoCapture(path)
         self.frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT) / self.vid_stride)
         self.orientation = int(self.cap.get(cv2.CAP_PROP_ORIENTATION_META))  # rotation degrees
@@ -341,9 +400,18 @@ class LoadImages:
 
 class LoadStreams:
     # YOLOv5 streamloader, i.e. `python detect.py --source 'rtsp://example.com/media.mp4'  # RTSP, RTMP, HTTP streams`
-    def __init__(self, sources='file.streams', img_size=640, stride=32, auto=True, transforms=None, vid_stride=1):
+    def __init__(self,
+                 sources='file.streams',
+                 img_size=640,
+                 stride=32,
+                 auto=True,
+                 transforms=None,
+                 vid_stride=1,
+                 latest=False):
+        # latest=True blocks __next__ until every stream has a frame it has not returned yet, then returns the newest
         torch.backends.cudnn.benchmark = True  # faster for fixed-size inference
         self.mode = 'stream'
+        self.latest = latest
         self.img_size = img_size
         self.stride = stride
         self.vid_stride = vid_stride  # video frame-rate stride
@@ -351,6 +419,10 @@ class LoadStreams:
         n = len(sources)
         self.sources = [clean_str(x) for x in sources]  # clean source names for later
         self.imgs, self.fps, self.frames, self.threads = [None] * n, [0] * n, [0] * n, [None] * n
+        self.caps, self.running = [None] * n, True
+        self.cond = Condition()  # guards imgs and frame counters, notified on every new frame
+        self.seq, self.consumed = [0] * n, [0] * n  # sequence number of the newest and of the last returned frame
+        self.captured, self.dropped, self.processed = [0] * n, [0] * n, [0] * n  # frame accounting
         for i, s in enumerate(sources):  # index, source
             # Start thread to read frames from video stream
             st = f'{i + 1}/{n}: {s}... '
@@ -365,6 +437,7 @@ class LoadStreams:
                 assert not is_kaggle(), '--source 0 webcam unsupported on Kaggle. Rerun command in a local environment.'
             cap = cv2.VideoCapture(s)
             assert cap.isOpened(), f'{st}Failed to open {s}'
+            self.caps[i] = cap
             w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
             h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
             fps = cap.get(cv2.CAP_PROP_FPS)  # warning: may return 0 or nan
@@ -372,6 +445,7 @@ class LoadStreams:
             self.fps[i] = max((fps if math.isfinite(fps) else 0) % 100, 0) or 30  # 30 FPS fallback
 
             _, self.imgs[i] = cap.read()  # guarantee first frame
+            self.seq[i] = self.captured[i] = 1
             self.threads[i] = Thread(target=self.update, args=([i, cap, s]), daemon=True)
             LOGGER.info(f'{st} Success ({self.frames[i]} frames {w}x{h} at {self.fps[i]:.2f} FPS)')
             self.threads[i].start()
@@ -388,18 +462,26 @@ class LoadStreams:
     def update(self, i, cap, stream):
         # Read stream `i` frames in daemon thread
         n, f = 0, self.frames[i]  # frame number, frame array
-        while cap.isOpened() and n < f:
+        while self.running and cap.isOpened() and n < f:
             n += 1
             cap.grab()  # .read() = .grab() followed by .retrieve()
             if n % self.vid_stride == 0:
                 success, im = cap.retrieve()
-                if success:
-                    self.imgs[i] = im
-                else:
+                if not success:
                     LOGGER.warning('WARNING ⚠️ Video stream unresponsive, please check your IP camera connection.')
-                    self.imgs[i] = np.zeros_like(self.imgs[i])
+                    im = np.zeros_like(self.imgs[i])
                     cap.open(stream)  # re-open stream if signal was lost
-            time.sleep(0.0)  # wait time
+                with self.cond:
+                    if self.seq[i] > self.consumed[i]:
+                        self.dropped[i] += 1  # previous frame overwritten before it was returned
+                    self.imgs[i] = im
+                    self.seq[i] += 1
+                    self.captured[i] += 1
+                    self.cond.notify_all()
+            if not self.latest:
+                time.sleep(0.0)  # wait time
+        with self.cond:
+            self.cond.notify_all()  # wake __next__ so it can stop
 
     def __iter__(self):
         self.count = -1
@@ -411,7 +493,16 @@ class LoadStreams:
             cv2.destroyAllWindows()
             raise StopIteration
 
-        im0 = self.imgs.copy()
+        with self.cond:
+            if self.latest:  # block until every stream has a new frame, no busy-waiting
+                while not all(s > c for s, c in zip(self.seq, self.consumed)):
+                    if not self.running or not all(x.is_alive() for x in self.threads):
+                        raise StopIteration
+                    self.cond.wait(timeout=1)
+            im0 = self.imgs.copy()
+            for i in range(len(im0)):
+                self.processed[i] += self.seq[i] > self.consumed[i]
+                self.consumed[i] = self.seq[i]
         if self.transforms:
             im = np.stack([self.transforms(x) for x in im0])  # transforms
         else:
@@ -421,6 +512,24 @@ class LoadStreams:
 
         return self.sources, im, im0, None, ''
 
+    def stats(self):
+        # Frame accounting per stream: captured by the reader, dropped unseen, and returned to the caller
+        with self.cond:
+            return {
+                'captured': list(self.captured),
+                'dropped': list(self.dropped),
+                'processed': list(self.processed)}
+
+    def close(self):
+        # Stop reader threads and release captures, i.e. when a long-lived caller stops detection
+        self.running = False
+        for thread in self.threads:
+            if thread is not None:
+                thread.join(timeout=5)
+        for cap in self.caps:
+            if cap is not None:
+                cap.release()
+
     def __len__(self):
         return len(self.sources)  # 1E12 frames = 32 streams at 30 FPS for 30 years
 
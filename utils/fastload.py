@@ -0,0 +1,95 @@
+# YOLOv5 🚀 by Ultralytics, AGPL-3.0 license
+"""
+Fast-load utils
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+
+import torch
+
+from utils.general import LOGGER, check_version, colorstr
+
+MMAP = check_version(torch.__version__, '2.1.0')  # torch.load(mmap=True) support
+
+
+def source_signature(weights):
+    # Size, mtime and torch version of the source weights, an artifact is rebuilt when any of them changes
+    st = os.stat(weights)
+    return f'{st.st_size}_{st.st_mtime_ns}_{torch.__version__}'
+
+
+def load_pt(weights):
+    # Fused, eval-mode FP32 model from PyTorch weights, as DetectMultiBackend loads it
+    from models.experimental import attempt_load  # scoped to avoid circular import
+
+    model = attempt_load(weights, device=torch.device('cpu'), inplace=True, fuse=True)
+    for p in model.parameters():
+        p.requires_grad = False
+    return model
+
+
+def save_fused(weights, f):
+    # Checkpoint that attempt_load() reads without fuse() and memory-maps where supported
+    torch.save({'model': load_pt(weights), 'fused': True, 'date': time.time()}, f)
+    return f
+
+
+def save_torchscript(weights, f, imgsz=(640, 640)):
+    # TorchScript trace of the fused model, fixed to imgsz since Detect grids are traced as constants
+    from export import export_torchscript  # scoped to avoid circular import
+    from models.yolo import Detect
+
+    model = load_pt(weights)
+    for m in model.modules():
+        if isinstance(m, Detect):
+            m.inplace = False
+            m.export = True  # single output tensor
+    im = torch.zeros(1, 3, *imgsz)
+    for _ in range(2):
+        model(im)  # dry runs
+    f, _ = export_torchscript(model, im, Path(f), False)
+    if f is None:
+        raise RuntimeError(f'TorchScript export of {weights} failed')
+    return f
+
+
+def fastload(weights, mode='fused', imgsz=(640, 640), device=torch.device('cpu')):
+    # Pre-fused ('fused') or traced ('torchscript') artifact of PyTorch weights, built once next to them
+    # Usage:
+    #     from utils.fastload import fastload
+    #     w = fastload('yolov5s.pt')  # i.e. 'yolov5s_fastload/yolov5s.pt'
+    #     model = DetectMultiBackend(w)
+    prefix = colorstr('FastLoad: ')
+    weights = Path(weights)
+    if weights.suffix != '.pt' or not weights.is_file():
+        return weights
+    if mode != 'torchscript' or device.type != 'cpu':
+        mode = 'fused'  # traces hold device constants, CUDA loads the fused checkpoint instead
+    imgsz = (imgsz, imgsz) if isinstance(imgsz, int) else tuple(imgsz)
+    cache_dir = weights.parent / f'{weights.stem}_fastload'
+    cache_file = cache_dir / 'fastload.json'
+    key = 'fused' if mode == 'fused' else f'torchscript_{imgsz[0]}x{imgsz[1]}'
+    cache = json.loads(cache_file.read_text()) if cache_file.is_file() else {}
+    signature = source_signature(weights)
+    if cache.get('source') != signature:  # weights replaced or torch upgraded
+        cache = {'source': signature, 'artifacts': {}}
+    if key in cache['artifacts'] and Path(cache['artifacts'][key]).is_file():
+        return Path(cache['artifacts'][key])
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        t0 = time.perf_counter()
+        if mode == 'fused':
+            f = save_fused(weights, cache_dir / weights.name)
+        else:
+            f = save_torchscript(weights, cache_dir / f'{weights.stem}_{imgsz[0]}x{imgsz[1]}.torchscript', imgsz)
+    except Exception as e:
+        LOGGER.warning(f'{prefix}WARNING ⚠️ {mode} artifact of {weights.name} failed, loading the weights: {e}')
+        return weights
+    cache['artifacts'][key] = str(f)
+    cache_file.write_text(json.dumps(cache, indent=2))
+    LOGGER.info(f'{prefix}saved {mode} artifact of {weights.name} in {time.perf_counter() - t0:.1f}s to {f} ✅')
+    return Path(f)
@@ -3,6 +3,7 @@
 General utils
 """
 
+import bisect
 import contextlib
 import glob
 import inspect
@@ -171,9 +172,13 @@ CONFIG_DIR = user_config_dir()  # Ultralytics settings dir
 
 class Profile(contextlib.ContextDecorator):
     # YOLOv5 Profile class. Usage: @Profile() decorator or 'with Profile():' context manager
-    def __init__(self, t=0.0):
+    HIST_EDGES = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0)  # latency histogram bins (s)
+
+    def __init__(self, t=0.0, hist=False):
         self.t = t
+        self.n = 0  # number of timed calls
         self.cuda = torch.cuda.is_available()
+        self.hist = [0] * (len(self.HIST_EDGES) + 1) if hist else None  # constant-memory latency histogram
 
     def __enter__(self):
         self.start = self.time()
@@ -182,6 +187,20 @@ class Profile(contextlib.ContextDecorator):
     def __exit__(self, type, value, traceback):
         self.dt = self.time() - self.start  # delta-time
         self.t += self.dt  # accumulate dt
+        self.n += 1
+        if self.hist is not None:
+            self.hist[bisect.bisect_left(self.HIST_EDGES, self.dt)] += 1
+
+    def percentile(self, q):
+        # Upper histogram bin edge (s) below which q% of timed calls fall, requires Profile(hist=True)
+        total = sum(self.hist)
+        if not total:
+            return 0.0
+        count = 0
+        for i, c in enumerate(self.hist):
+            count += c
+            if count >= total * q / 100:
+                return self.HIST_EDGES[i] if i < len(self.HIST_EDGES) else float('inf')
 
     def time(self):
         if self.cuda: